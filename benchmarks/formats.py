@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""Compare the startup time and memory of the script and zipapp output formats.
+
+A synthetic repository of packages and modules is built in every output format, then each output is run several times
+in a fresh interpreter, importing every inlined module. The median wall time and the peak RSS of the runs are reported.
+
+Usage:
+    python benchmarks/formats.py [--packages 20] [--modules 25] [--runs 15]
+"""
+
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from argparse import ArgumentParser
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from inline_importer import builder  # noqa: E402
+from inline_importer.inliner import Repository  # noqa: E402
+
+MODULE_TEMPLATE = '''"""Synthetic module {name}."""
+import os
+import sys
+
+CONSTANT = {index!r}
+
+
+class Widget{index}:
+    def __init__(self, value):
+        self.value = value
+
+    def compute(self, factor=2):
+        return [self.value * factor + i for i in range(10)]
+
+
+def helper_{index}(values):
+    return sum(Widget{index}(v).compute()[0] for v in values)
+'''
+
+ENTRYPOINT_TEMPLATE = """import resource
+import sys
+{imports}
+sys.stdout.write(str(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss))
+"""
+
+
+def build_repository(packages, modules):
+    """Build a repository of packages, each containing modules."""
+    repository = Repository()
+    for p in range(packages):
+        package = "bench_pkg{}".format(p)
+        repository.insert_module(package, "", True)
+        for m in range(modules):
+            name = "{}.mod{}".format(package, m)
+            repository.insert_module(name, MODULE_TEMPLATE.format(name=name, index=m), False)
+
+    return repository
+
+
+def measure(path, runs):
+    """Run path in fresh interpreters, returning the median wall time (s) and the peak RSS (KiB)."""
+    times, rss = [], []
+    for _ in range(runs):
+        start = time.perf_counter()
+        output = subprocess.check_output([sys.executable, "-I", "-S", path])
+        times.append(time.perf_counter() - start)
+        rss.append(int(output))
+
+    return statistics.median(times), max(rss)
+
+
+def main():
+    parser = ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--packages", type=int, default=20)
+    parser.add_argument("--modules", type=int, default=25)
+    parser.add_argument("--runs", type=int, default=15)
+    args = parser.parse_args()
+
+    repository = build_repository(args.packages, args.modules)
+    entrypoint = ENTRYPOINT_TEMPLATE.format(imports="\n".join("import {}".format(name) for name in repository))
+
+    with tempfile.TemporaryDirectory() as directory:
+        outputs = [
+            ("script", os.path.join(directory, "bundle.py"), builder.write_file),
+            ("pyz", os.path.join(directory, "bundle.pyz"), builder.write_pyz),
+            ("pyz --precompile", os.path.join(directory, "bundle-pyc.pyz"), builder.write_pyz),
+        ]
+
+        print("{} modules, {} runs per format".format(len(repository), args.runs))
+        print("{:<20} {:>10} {:>12} {:>14}".format("format", "size (KiB)", "median (ms)", "peak RSS (KiB)"))
+        for label, path, write in outputs:
+            kwargs = {"precompile": True} if "precompile" in label else {}
+            write(path, repository, entrypoint, **kwargs)
+            median, peak = measure(path, args.runs)
+            size = os.stat(path).st_size // 1024
+            print("{:<20} {:>10} {:>12.1f} {:>14}".format(label, size, median * 1000, peak))
+
+
+if __name__ == "__main__":
+    main()
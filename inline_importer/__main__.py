@@ -2,7 +2,7 @@ import os
 import sys
 from argparse import ArgumentDefaultsHelpFormatter, ArgumentParser, ArgumentTypeError, SUPPRESS
 
-from inline_importer import __version__, builder, inliner
+from inline_importer import __version__, builder, check, delta, inliner, pipeline
 
 
 def _ternary_type(value):
@@ -22,6 +22,20 @@ def _ternary_type(value):
     raise ArgumentTypeError("{!r} is not a valid ternary value (None, True, False)".format(value))
 
 
+def _positive_int(value):
+    """Convert a string to a strictly positive integer.
+    """
+    try:
+        val = int(value)
+    except ValueError:
+        val = 0
+
+    if val < 1:
+        raise ArgumentTypeError("{!r} is not a positive integer".format(value))
+
+    return val
+
+
 def parse_args(name):
     parser = ArgumentParser(name, description="", add_help=True, allow_abbrev=True)
 
@@ -58,6 +72,79 @@ def parse_args(name):
         default="inline_importer.importer",
     )
 
+    parser.add_argument(
+        "--strip-typing",
+        help="Remove TYPE_CHECKING blocks and the imports only used in them or in local variable annotations from "
+             "inlined modules. Line numbers are preserved",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--drop-annotations",
+        help="Also remove function annotations from inlined modules, so that the imports they use can be pruned. "
+             "Implies --strip-typing",
+        action="store_true",
+    )
+
+    parser.add_argument(
+        "-j", "--jobs", help="Number of worker processes used to read, transform and validate modules", default=1,
+        type=_positive_int,
+    )
+    parser.add_argument("--validate", help="Compile every inlined module while building", action="store_true")
+    parser.add_argument("--stats", help="Print per-stage build timings on stderr", action="store_true")
+
+    parser.add_argument(
+        "--inline-stdlib",
+        help="Also inline the pure-python standard library modules imported (at import time) by the entrypoint and "
+             "the inlined modules. They are only used by the same interpreter version as the one building the script",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--stdlib-module",
+        help="Name of a standard library module to inline along with its dependencies, e.g. one imported inside a "
+             "function. Implies --inline-stdlib",
+        dest="stdlib_modules",
+        default=[],
+        nargs="*",
+    )
+
+    parser.add_argument(
+        "--zygote",
+        help="Run the script through a fork-server: the first invocation starts a background process that imports "
+             "the modules once, later invocations are served by forked, pre-warmed children (POSIX, python 3.9+)",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--zygote-idle-timeout",
+        help="Number of seconds after which an idle zygote exits",
+        default=600,
+        type=_positive_int,
+    )
+    parser.add_argument(
+        "--zygote-preload",
+        help="Fully qualified names of the modules the zygote imports before serving. Defaults to the inlined "
+             "modules imported by the entrypoint",
+        default=None,
+        nargs="*",
+    )
+
+    parser.add_argument(
+        "--absent-module",
+        help="Name of a module known to be missing at runtime, e.g. an optional accelerator probed with "
+             "`try: import x except ImportError`. Importing it fails immediately instead of searching sys.path",
+        dest="absent_modules",
+        default=[],
+        nargs="*",
+    )
+    parser.add_argument(
+        "--detect-absent",
+        help="Mark as absent the modules probed by guarded imports of the inlined modules that the given target "
+             "interpreter (defaults to this one) cannot find",
+        metavar="PYTHON",
+        nargs="?",
+        const=sys.executable,
+        default=None,
+    )
+
     inputs = parser.add_argument_group()
     inputs.add_argument(
         "-f",
@@ -76,13 +163,82 @@ def parse_args(name):
         default=[],
         nargs="*",
     )
+    inputs.add_argument(
+        "-a",
+        "--input-archive",
+        help="Path to a tar (optionally compressed), zip or wheel archive whose modules and packages should be "
+             "inlined, without extracting it. Use ARCHIVE#ROOT to only consider the ROOT directory of the archive, and "
+             "- to read a tar stream (e.g. from git archive) on stdin",
+        dest="input_archives",
+        default=[],
+        nargs="*",
+    )
+    inputs.add_argument(
+        "-d",
+        "--input-distribution",
+        help="Name of an installed distribution whose metadata (version, entry points) should be inlined, so that "
+             "importlib.metadata lookups for it are answered by the importer",
+        dest="input_distributions",
+        default=[],
+        nargs="*",
+    )
 
     parser.add_argument(
         "-o", "--output-file", help="Name of the output file. Use - to output to stdout instead", required=True
     )
+    parser.add_argument(
+        "--output-format",
+        help="Format of the output file. script inlines the modules with the importer in a python script, pyz writes "
+             "a zipapp loaded by python's zipimport (the importer options do not apply)",
+        default="script",
+        choices=("script", "pyz"),
+    )
+    parser.add_argument(
+        "--payload-format",
+        help="How sources are stored in the script. dict stores one str per module, blob packs them in a single "
+             "bytes object decoded on demand, whose memory stays shared between forked processes",
+        default="dict",
+        choices=("dict", "blob"),
+    )
+    parser.add_argument(
+        "--preload",
+        help="Import every inlined module and freeze the garbage collector before running the entrypoint, for "
+             "pre-fork servers",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--precompile", help="Add precompiled .pyc entries to the zipapp (pyz format only)", action="store_true"
+    )
 
     args = parser.parse_args()
 
+    if args.output_format == "pyz" and (args.inline_stdlib or args.stdlib_modules):
+        parser.error("the standard library cannot be inlined in a zipapp, as it would shadow the real one")
+
+    if args.output_format == "pyz" and args.zygote:
+        parser.error("the zygote mode is only available for scripts")
+
+    if args.output_format == "pyz" and (args.absent_modules or args.detect_absent):
+        parser.error("absent modules are only available for scripts, zipapps are imported by zipimport")
+
+    if args.output_format == "pyz":
+        # The importer is not part of a zipapp, so none of its options apply.
+        ignored = [
+            option for option, is_set in (
+                ("--payload-format", args.payload_format != parser.get_default("payload_format")),
+                ("--preload", args.preload),
+                ("-n/--namespace-inlined-packages", args.namespace_inlined_packages is not None),
+                ("-i/--importer-module", args.importer_module != parser.get_default("importer_module")),
+            )
+            if is_set
+        ]
+        if ignored:
+            parser.error("{} only available for scripts, zipapps are imported by zipimport".format(
+                " and ".join(ignored) + (" are" if len(ignored) > 1 else " is")
+            ))
+    elif args.precompile:
+        parser.error("--precompile is only available for zipapps")
+
     if args.no_shebang:
         args.shebang = None
 
@@ -92,10 +248,100 @@ def parse_args(name):
     return args
 
 
+def _read_binary(filename):
+    """Read a file as bytes, - being the standard input."""
+    if filename == "-":
+        return sys.stdin.buffer.read()
+
+    with open(filename, "rb") as f:
+        return f.read()
+
+
+def _write_binary(filename, data):
+    """Write bytes to a file, - being the standard output."""
+    if filename == "-":
+        sys.stdout.buffer.write(data)
+        return
+
+    with open(filename, "wb") as f:
+        f.write(data)
+
+
+def diff_main(name, argv):
+    parser = ArgumentParser(
+        name, description="Build a patch of the modules that changed between two versions of a bundle script"
+    )
+    parser.add_argument("old", help="Path to the old bundle")
+    parser.add_argument("new", help="Path to the new bundle")
+    parser.add_argument(
+        "-o", "--output-file", help="Name of the patch file. Use - to output to stdout instead", required=True
+    )
+    args = parser.parse_args(argv)
+
+    _write_binary(args.output_file, delta.diff_bundles(_read_binary(args.old), _read_binary(args.new)))
+
+
+def apply_main(name, argv):
+    parser = ArgumentParser(
+        name, description="Rebuild the new version of a bundle script from the old version and a patch"
+    )
+    parser.add_argument("old", help="Path to the old bundle")
+    parser.add_argument("patch", help="Path to the patch, as built by the diff command. Use - to read it from stdin")
+    parser.add_argument(
+        "-o", "--output-file", help="Name of the new bundle. Use - to output to stdout instead", required=True
+    )
+    args = parser.parse_args(argv)
+
+    _write_binary(args.output_file, delta.apply_patch(_read_binary(args.old), _read_binary(args.patch)))
+
+
+def check_main(name, argv):
+    parser = ArgumentParser(
+        name, description="Import every module of a bundle (script or zipapp), each in a fresh interpreter"
+    )
+    parser.add_argument("bundle", help="Path to the bundle")
+    parser.add_argument(
+        "-m", "--module", help="Fully qualified name of a module to check. Defaults to every module of the bundle",
+        dest="modules", default=None, nargs="*",
+    )
+    parser.add_argument(
+        "-j", "--jobs", help="Number of interpreters running at once. Defaults to the number of CPUs", default=None,
+        type=_positive_int,
+    )
+    parser.add_argument("--python", help="Interpreter importing the modules", default=sys.executable)
+    parser.add_argument(
+        "--timeout", help="Number of seconds after which an import is considered failed", default=60,
+        type=_positive_int,
+    )
+    args = parser.parse_args(argv)
+
+    results = check.check_bundle(args.bundle, args.modules, jobs=args.jobs, python=args.python, timeout=args.timeout)
+
+    print("{:<48} {:>10} {:>10}  {}".format("module", "time (ms)", "RSS (KiB)", "status"))
+    for result in results:
+        rss = "-" if result.rss is None else result.rss
+        status = "ok" if result.ok else "FAILED: {}".format(result.error)
+        print("{:<48} {:>10.1f} {:>10}  {}".format(result.name, result.seconds * 1000, rss, status))
+
+    failed = [result.name for result in results if not result.ok]
+    print("{} modules checked, {} failed".format(len(results), len(failed)))
+    if failed:
+        sys.exit(1)
+
+
+COMMANDS = {"diff": diff_main, "apply": apply_main, "check": check_main}
+"""Subcommands, selected by the first argument. Without one, the arguments build a script.
+"""
+
+
 def main():
     name = os.path.basename(sys.argv[0])
     if name == "__main__.py":
         name = "{} -m {}".format(os.path.basename(sys.executable), __package__)
+
+    if sys.argv[1:2] and sys.argv[1] in COMMANDS:
+        return COMMANDS[sys.argv[1]]("{} {}".format(name, sys.argv[1]), sys.argv[2:])
+
     args = parse_args(name)
 
     # Collect and inline the modules
@@ -106,10 +352,56 @@ def main():
     if args.entrypoint_module:
         entrypoint = inliner.get_module_source(args.entrypoint_module)
 
-    inlined = inliner.build_inlined(modules=args.input_files, packages=args.input_packages)
+    build_pipeline = pipeline.Pipeline.default(
+        workers=args.jobs,
+        validate=args.validate,
+        strip_typing=args.strip_typing,
+        drop_annotations=args.drop_annotations,
+    )
+    inlined = inliner.build_inlined(
+        modules=args.input_files,
+        packages=args.input_packages,
+        pipeline=build_pipeline,
+        archives=[tuple(archive.partition("#")[::2]) for archive in args.input_archives],
+    )
+    if args.stats:
+        print(build_pipeline.format_statistics(), file=sys.stderr)
+    for name, modules in build_pipeline.reports.get("transform", {}).items():
+        print("{}: no longer imports {}".format(name, ", ".join(modules)), file=sys.stderr)
+    distributions = inliner.build_distributions(args.input_distributions)
+
+    stdlib = inliner.Repository()
+    if args.inline_stdlib or args.stdlib_modules:
+        stdlib = inliner.build_stdlib(inlined, entrypoint, args.stdlib_modules)
+        for module_def in stdlib.values():
+            inlined.insert_module(module_def.name, module_def.source, module_def.is_package)
+
+    absent = set(args.absent_modules)
+    if args.detect_absent:
+        probed = inliner.find_optional_imports(inlined)
+        probed.update(inliner.find_guarded_imports(entrypoint, "__main__").difference(inlined))
+        detected = inliner.find_absent_modules(probed, args.detect_absent)
+        if detected:
+            print("absent modules: {}".format(", ".join(sorted(detected))), file=sys.stderr)
+        absent.update(detected)
 
     # Build the inlined script
     output = args.output_file
+
+    if args.output_format == "pyz":
+        if output == "-":
+            output = sys.stdout.buffer
+
+        builder.write_pyz(
+            output,
+            inlined_modules=inlined,
+            entrypoint=entrypoint,
+            shebang=args.shebang,
+            precompile=args.precompile,
+            distributions=distributions,
+        )
+        return
+
     if output == "-":
         output = sys.stdout
 
@@ -119,6 +411,14 @@ def main():
         entrypoint=entrypoint,
         importer_module=args.importer_module,
         shebang=args.shebang,
+        distributions=distributions,
+        payload_format=args.payload_format,
+        preload=args.preload,
+        stdlib_modules=list(stdlib),
+        zygote=args.zygote,
+        zygote_idle_timeout=args.zygote_idle_timeout,
+        zygote_preload=args.zygote_preload,
+        absent_modules=absent,
     )
 
 
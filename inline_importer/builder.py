@@ -1,13 +1,36 @@
-from io import StringIO
+import hashlib
+import importlib.util
+import marshal
+import os
+import sys
+import zipfile
+from io import BytesIO, StringIO
 
-from inline_importer import __version__ as inline_importer_version
-from inline_importer.inliner import ModuleDefinition, get_module_source
+from inline_importer import __version__ as inline_importer_version, InlinerException
+from inline_importer.importer import InlineImporter
+from inline_importer.inliner import ModuleDefinition, find_module_imports, get_module_source
+
+ZYGOTE_MODULE = "_inline_importer_zygote"
+"""The name under which the zygote runtime is inlined in scripts built in zygote mode.
+"""
 
 
 def build_file(
-    inlined_modules, entrypoint, importer_module="inline_importer.importer", shebang=None, namespace_packages=None
+    inlined_modules,
+    entrypoint,
+    importer_module="inline_importer.importer",
+    shebang=None,
+    namespace_packages=None,
+    distributions=None,
+    payload_format="dict",
+    preload=False,
+    stdlib_modules=None,
+    zygote=False,
+    zygote_idle_timeout=600,
+    zygote_preload=None,
+    absent_modules=None,
 ):
-    # type: (Union[Repository, Dict[str, ModuleDefinition]], str, Union[str, ModuleType], Optional[str], Optional[bool]) -> str
+    # type: (Union[Repository, Dict[str, ModuleDefinition]], str, Union[str, ModuleType], Optional[str], Optional[bool], Optional[Dict[str, Dict[str, str]]], str, bool, Optional[List[str]], bool, float, Optional[List[str]], Optional[List[str]]) -> str
     """Builds an single file script containing the importer module.
 
     This function returns the inlined script as a string.
@@ -19,6 +42,24 @@ def build_file(
         importer_module (str, optional): the fully-qualified name of the importer module to inline with the script
         shebang (bool, optional): whether to include a shebang at the top of the script
         namespace_packages (bool, optional): Whether to treat packages as **PEP 420** namespace packages.
+        distributions (dict(str, dict(str, str)), optional): Index of distribution metadata, as built by
+            `~inline_importer.inliner.build_distributions`
+        payload_format (str, optional): How the sources are stored. ``dict`` stores each source as a str in the
+            inlined modules dictionary. ``blob`` packs all the sources in a single bytes object, which the importer
+            decodes on demand. The blob is never written to once loaded, so its memory stays shared between forked
+            processes.
+        preload (bool, optional): Whether to import every inlined module and freeze the garbage collector before
+            running the entrypoint (see ``InlineImporter.preload``).
+        stdlib_modules (list(str), optional): The names of the inlined modules taken from the standard library of this
+            interpreter, as built by `~inline_importer.inliner.build_stdlib`. They are only used by an interpreter of
+            the same implementation and exact version, others fall back to their own standard library.
+        zygote (bool, optional): Whether to run the entrypoint through a fork-server (see `inline_importer.zygote`).
+        zygote_idle_timeout (float, optional): The number of seconds after which an idle zygote exits.
+        zygote_preload (list(str), optional): The modules imported by the zygote before serving. Defaults to the
+            inlined modules imported by the entrypoint.
+        absent_modules (list(str), optional): The names of modules known to be missing at runtime (see
+            `~inline_importer.inliner.find_optional_imports`). Importing them fails immediately, instead of searching
+            every entry of ``sys.path``.
 
     Returns:
         str: The source of the self-contained script.
@@ -26,6 +67,16 @@ def build_file(
 
     importer_source = get_module_source(importer_module)
 
+    if zygote:
+        if zygote_preload is None:
+            zygote_preload = sorted(find_module_imports(entrypoint, "__main__").intersection(inlined_modules))
+
+        zygote_def = ModuleDefinition(ZYGOTE_MODULE, False, get_module_source("inline_importer.zygote"))
+        inlined_modules = dict(inlined_modules, **{ZYGOTE_MODULE: zygote_def})
+        entrypoint = "import {0}\n{0}.main({1!r}, globals(), {2!r}, {3!r}, {4!r})\n".format(
+            ZYGOTE_MODULE, entrypoint, fingerprint(inlined_modules, entrypoint), zygote_idle_timeout, zygote_preload
+        )
+
     with StringIO() as f:
         if shebang:
             f.write(shebang)
@@ -37,6 +88,67 @@ def build_file(
         f.write("InlineImporter.version = {!r}\n".format(inline_importer_version))
         if namespace_packages is not None:
             f.write("InlineImporter.namespace_packages = {!r}\n".format(bool(namespace_packages)))
+        write_modules(f, inlined_modules, payload_format)
+
+        if stdlib_modules:
+            names = ", ".join(repr(name) for name in sorted(stdlib_modules))
+            f.write("InlineImporter.stdlib_modules = frozenset([{}])\n".format(names))
+            f.write("InlineImporter.stdlib_version = {!r}\n".format((sys.implementation.name, sys.hexversion)))
+
+        if absent_modules:
+            names = ", ".join(repr(name) for name in sorted(absent_modules))
+            f.write("InlineImporter.absent_modules = frozenset([{}])\n".format(names))
+
+        if distributions:
+            f.write("InlineImporter.distributions = {\n")
+            for name, files in distributions.items():
+                f.write("    {!r}: {!r},\n".format(name, files))
+            f.write("}\n")
+
+        f.write("_sys.meta_path.insert(2, InlineImporter)\n")
+        if preload:
+            f.write("InlineImporter.preload()\n")
+        f.write("\n" "# Entrypoint\n")
+        f.write(entrypoint)
+
+        return f.getvalue()
+
+
+def fingerprint(inlined_modules, entrypoint):
+    # type: (Union[Repository, Dict[str, ModuleDefinition]], str) -> str
+    """Compute the content fingerprint (hex SHA-256) of the modules and entrypoint of a script.
+
+    Args:
+        inlined_modules (`~inline_importer.inliner.Repository` or dict(str,
+            `~inline_importer.inliner.ModuleDefinition`)): Repository of modules
+        entrypoint (str): the source code of the entrypoint
+
+    Returns:
+        str: the fingerprint
+    """
+    digest = hashlib.sha256(inline_importer_version.encode("utf-8"))
+    for name, module_def in inlined_modules.items():
+        digest.update(repr((name, bool(module_def.is_package), module_def.source)).encode("utf-8"))
+    digest.update(entrypoint.encode("utf-8"))
+
+    return digest.hexdigest()
+
+
+def write_modules(f, inlined_modules, payload_format="dict"):
+    """Write the statements defining the inlined modules of a script.
+
+    Args:
+        f (`file`-like object): the file to write to
+        inlined_modules (`~inline_importer.inliner.Repository` or dict(str,
+            `~inline_importer.inliner.ModuleDefinition`)): Repository of modules
+        payload_format (str, optional): How the sources are stored, see `build_file`.
+
+    Raises:
+        `~inline_importer.InlinerException`: If the payload format is unknown.
+    """
+    if payload_format == "blob":
+        _write_blob_modules(f, inlined_modules)
+    elif payload_format == "dict":
         f.write("InlineImporter.inlined_modules = {\n")
 
         for name, module_def in inlined_modules.items():
@@ -45,10 +157,27 @@ def build_file(
             f.write("    {!r}: ({!r}, {!r}),\n".format(name, bool(module_def.is_package), module_def.source))
 
         f.write("}\n")
-        f.write("_sys.meta_path.insert(2, InlineImporter)\n" "\n" "# Entrypoint\n")
-        f.write(entrypoint)
+    else:
+        raise InlinerException("Unknown payload format {!r}".format(payload_format))
 
-        return f.getvalue()
+
+def _write_blob_modules(f, inlined_modules):
+    """Write the inlined modules as a payload blob and an index of (offset, length) entries."""
+    payload, packed = InlineImporter.pack_payload(
+        {name: (bool(module_def.is_package), module_def.source) for name, module_def in inlined_modules.items()}
+    )
+
+    # One bytes literal per module, concatenated by the compiler into a single constant.
+    f.write("InlineImporter.payload = (\n")
+    f.write("    b''\n")
+    for _, (offset, length) in packed.values():
+        f.write("    {!r}\n".format(payload[offset:offset + length]))
+    f.write(")\n")
+
+    f.write("InlineImporter.inlined_modules = {\n")
+    for name, (is_package, span) in packed.items():
+        f.write("    {!r}: ({!r}, {!r}),\n".format(name, is_package, span))
+    f.write("}\n")
 
 
 def write_file(file_or_filename, *args, **kwargs):
@@ -72,3 +201,123 @@ def write_file(file_or_filename, *args, **kwargs):
 
     with open(file_or_filename, "w") as f:
         return f.write(build_file(*args, **kwargs))
+
+
+ZIP_DATE_TIME = (1980, 1, 1, 0, 0, 0)
+"""The timestamp of every zipapp entry, so that builds are reproducible.
+"""
+
+
+def _archive_name(module_def):
+    """The path of a module inside a zipapp."""
+    path = module_def.name.replace(".", "/")
+    if module_def.is_package:
+        path = "/".join([path, "__init__"])
+
+    return ".".join([path, "py"])
+
+
+def _compile_pyc(source, path):
+    """Compile source to the contents of an unchecked hash-based ``.pyc`` file (**PEP 552**).
+
+    Unchecked pycs are used as-is by ``zipimport``, without comparing them to the source or to the archive timestamps.
+    """
+    source_bytes = source.encode("utf-8")
+    code = compile(source_bytes, path, "exec", dont_inherit=True)
+
+    flags = (0b01).to_bytes(4, "little")
+    return b"".join([importlib.util.MAGIC_NUMBER, flags, importlib.util.source_hash(source_bytes), marshal.dumps(code)])
+
+
+def _distribution_directory(name, files):
+    """The name of the ``.dist-info`` directory of an inlined distribution."""
+    for line in files.get("METADATA", files.get("PKG-INFO", "")).splitlines():
+        key, _, value = line.partition(":")
+        if key == "Version":
+            return "{}-{}.dist-info".format(name, value.strip())
+        if not line:
+            break
+
+    return "{}.dist-info".format(name)
+
+
+def build_pyz(inlined_modules, entrypoint, shebang=None, precompile=False, distributions=None):
+    # type: (Union[Repository, Dict[str, ModuleDefinition]], str, Optional[str], bool, Optional[Dict[str, Dict[str, str]]]) -> bytes
+    """Builds a zipapp containing the inlined modules.
+
+    The zipapp is imported by python's own ``zipimport`` machinery rather than by the importer, and the entrypoint
+    becomes its ``__main__.py``. Entries are sorted and stored uncompressed, so the central directory is cheap to read.
+
+    This function returns the zipapp as bytes.
+
+    Args:
+        inlined_modules (`~inline_importer.inliner.Repository` or dict(str,
+            `~inline_importer.inliner.ModuleDefinition`)): Repository of modules
+        entrypoint (str): the source code of the entrypoint
+        shebang (str, optional): the shebang line to place in front of the archive
+        precompile (bool, optional): whether to add precompiled ``.pyc`` entries next to the sources
+        distributions (dict(str, dict(str, str)), optional): Index of distribution metadata, as built by
+            `~inline_importer.inliner.build_distributions`. Each distribution is stored as a ``.dist-info`` directory.
+
+    Returns:
+        bytes: The contents of the zipapp.
+    """
+
+    entries = {"__main__.py": entrypoint.encode("utf-8")}
+
+    for module_def in inlined_modules.values():
+        path = _archive_name(module_def)
+        entries[path] = module_def.source.encode("utf-8")
+        if precompile:
+            entries[path + "c"] = _compile_pyc(module_def.source, path)
+
+    for name, files in (distributions or {}).items():
+        directory = _distribution_directory(name, files)
+        for filename, text in files.items():
+            entries["/".join([directory, filename])] = text.encode("utf-8")
+
+    with BytesIO() as f:
+        if shebang:
+            f.write(shebang.encode("utf-8"))
+            f.write(b"\n")
+
+        with zipfile.ZipFile(f, "w", compression=zipfile.ZIP_STORED) as archive:
+            for path in sorted(entries):
+                info = zipfile.ZipInfo(path, ZIP_DATE_TIME)
+                info.external_attr = 0o644 << 16
+                archive.writestr(info, entries[path])
+
+        return f.getvalue()
+
+
+def write_pyz(file_or_filename, inlined_modules, entrypoint, shebang=None, **kwargs):
+    """Build a zipapp and write it to filename.
+
+    Other than a filename, the rest of the arguments are passed verbatim to build_pyz. If a filename is given and the
+    zipapp has a shebang, the file is made executable.
+
+    Args:
+        file_or_filename (`file`-like object or `str`-like): Either a binary file-like object with a `write` method or
+            a str-like object representing a filename.
+        inlined_modules: parameter from `build_pyz`
+        entrypoint: parameter from `build_pyz`
+        shebang: parameter from `build_pyz`
+        **kwargs: other parameters from `build_pyz`
+
+    Returns:
+        int: The number of bytes written to file_or_filename
+    """
+
+    pyz = build_pyz(inlined_modules, entrypoint, shebang=shebang, **kwargs)
+
+    if hasattr(file_or_filename, "write"):
+        # noinspection PyCallingNonCallable
+        return file_or_filename.write(pyz)
+
+    with open(file_or_filename, "wb") as f:
+        written = f.write(pyz)
+
+    if shebang:
+        os.chmod(file_or_filename, os.stat(file_or_filename).st_mode | 0o111)
+
+    return written
@@ -0,0 +1,240 @@
+"""Smoke-check of the modules of a built bundle.
+
+Each module is imported from the bundle in a fresh interpreter, so modules that only fail once inlined (e.g. because
+they read files relative to ``__file__``, or import a sibling that was not inlined) are found before shipping. The
+interpreters run in isolated mode (``-I``), so neither the current directory nor ``PYTHONPATH`` can hide a missing
+module.
+
+Script bundles are checked by importing everything before their entrypoint as a module, whose bytecode is cached after
+the first check. Zipapps are checked by adding them to ``sys.path``.
+"""
+
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import zipfile
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+from inline_importer import InlinerException
+from inline_importer.importer import InlineImporter
+
+ENTRYPOINT_MARKER = "\n# Entrypoint\n"
+"""The comment separating the entrypoint of a script bundle from its modules and importer.
+"""
+
+CheckResult = namedtuple("CheckResult", "name ok seconds rss error")
+"""A named tuple holding the outcome of importing a module: whether it succeeded, the import time (in seconds), the
+growth of the resident set size (in KiB, None if unavailable) and the error if it failed.
+"""
+
+_PREFIX_MODULE = "_inline_importer_check_bundle"
+
+# Imports modules from the bundle, forking a child per module where possible, and reports one JSON line per module.
+_WORKER_SCRIPT = """
+import importlib, json, os, signal, sys, time, traceback
+
+def rss():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") // 1024
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import resource
+    except ImportError:
+        return None
+    # Only the peak is available: imports below the peak reached at startup are not accounted for.
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak // 1024 if sys.platform == "darwin" else peak
+
+def check(name):
+    before = rss()
+    start = time.perf_counter()
+    error = None
+    try:
+        importlib.import_module(name)
+    except BaseException as e:
+        error = traceback.format_exception_only(type(e), e)[-1].strip()
+    seconds = time.perf_counter() - start
+    after = rss()
+    return [error, seconds, None if before is None or after is None else after - before]
+
+path, prefix, mode, timeout = sys.argv[1], sys.argv[2], sys.argv[3], int(sys.argv[4])
+names = json.loads(sys.stdin.read())
+
+# Keep the reports apart from whatever the modules print
+out = os.fdopen(os.dup(1), "w")
+null = os.open(os.devnull, os.O_WRONLY)
+os.dup2(null, 1)
+
+sys.path.insert(0, path)
+if prefix:
+    importlib.import_module(prefix)
+
+for name in names:
+    if mode == "inline":
+        out.write(json.dumps([name] + check(name)) + "\\n")
+        continue
+
+    start = time.perf_counter()
+    r, w = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        try:
+            os.close(r)
+            signal.alarm(timeout)
+            data = json.dumps(check(name)).encode("utf-8")
+            while data:
+                data = data[os.write(w, data):]
+        finally:
+            os._exit(0)
+    os.close(w)
+    with os.fdopen(r, "rb") as f:
+        data = f.read()
+    _, status = os.waitpid(pid, 0)
+
+    if data:
+        result = json.loads(data.decode("utf-8"))
+    elif os.WIFSIGNALED(status) and os.WTERMSIG(status) == signal.SIGALRM:
+        result = ["timed out after {}s".format(timeout), time.perf_counter() - start, None]
+    elif os.WIFSIGNALED(status):
+        result = ["killed by signal {}".format(os.WTERMSIG(status)), time.perf_counter() - start, None]
+    else:
+        result = ["exited with status {}".format(os.WEXITSTATUS(status)), time.perf_counter() - start, None]
+    out.write(json.dumps([name] + result) + "\\n")
+    out.flush()
+"""
+
+
+def list_modules(bundle):
+    # type: (str) -> List[str]
+    """List the modules of a bundle, in the order they were inlined.
+
+    Inlined standard library modules are not listed: they are taken from the interpreter building the bundle as a
+    whole, including modules that only import on other platforms.
+
+    Args:
+        bundle (str): the path of a script or zipapp built by the builder
+
+    Returns:
+        list(str): the fully qualified names of the modules
+
+    Raises:
+        `~inline_importer.InlinerException`: If the file is not a bundle.
+    """
+    if zipfile.is_zipfile(bundle):
+        names = []
+        with zipfile.ZipFile(bundle) as archive:
+            for entry in archive.namelist():
+                base, ext = os.path.splitext(entry)
+                if ext not in (".py", ".pyc") or entry == "__main__.py" or "/__pycache__/" in "/" + entry:
+                    continue
+                if base.endswith("/__init__"):
+                    base = base[: -len("/__init__")]
+                name = base.replace("/", ".")
+                if name not in names:
+                    names.append(name)
+
+        return names
+
+    try:
+        attributes = InlineImporter.read_bundle_attributes(bundle)
+    except (OSError, SyntaxError, ValueError, ImportError) as e:
+        raise InlinerException("Unable to read the modules of {!r}: {}".format(bundle, e))
+
+    stdlib = attributes.get("stdlib_modules", ())
+    return [name for name in attributes["inlined_modules"] if name not in stdlib]
+
+
+def _run_worker(path, prefix, names, python, timeout):
+    """Check names in a worker interpreter, returning a CheckResult per name."""
+    mode = "fork" if hasattr(os, "fork") else "inline"
+    start = time.perf_counter()
+    try:
+        result = subprocess.run(
+            [python, "-I", "-c", _WORKER_SCRIPT, path, prefix, mode, str(timeout)],
+            input=json.dumps(names).encode("utf-8"),
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            cwd=os.path.dirname(path),
+            # Forked children time out on their own
+            timeout=None if mode == "fork" else timeout,
+        )
+    except subprocess.TimeoutExpired:
+        seconds = time.perf_counter() - start
+        return [CheckResult(name, False, seconds, None, "timed out after {}s".format(timeout)) for name in names]
+
+    results = {}
+    for line in result.stdout.decode("utf-8", "replace").splitlines():
+        name, error, seconds, rss = json.loads(line)
+        results[name] = CheckResult(name, error is None, seconds, rss, error)
+
+    # The worker died (e.g. the bundle itself failed to load) before reporting every module
+    stderr = result.stderr.decode("utf-8", "replace").strip().splitlines()
+    error = "worker exited with status {}{}".format(result.returncode, ": " + stderr[-1] if stderr else "")
+    seconds = time.perf_counter() - start
+
+    return [results.get(name) or CheckResult(name, False, seconds, None, error) for name in names]
+
+
+def check_bundle(bundle, names=None, jobs=None, python=sys.executable, timeout=60):
+    # type: (str, Optional[List[str]], Optional[int], str, int) -> List[CheckResult]
+    """Import every module of a bundle, each in a fresh interpreter.
+
+    Where ``os.fork`` is available, each worker interpreter loads the bundle once, then forks a child per module, so
+    every module is imported in a pristine copy of that interpreter. Elsewhere, each module gets its own interpreter.
+
+    Args:
+        bundle (str): the path of a script or zipapp built by the builder
+        names (list(str), optional): the modules to check. Defaults to every module of the bundle.
+        jobs (int, optional): the number of workers running at once. Defaults to the number of CPUs.
+        python (str): the path of the interpreter
+        timeout (int): the number of seconds after which an import is considered failed
+
+    Returns:
+        list(`CheckResult`): the outcome of each import, in the order of names
+
+    Raises:
+        `~inline_importer.InlinerException`: If the file is not a bundle.
+    """
+    if names is None:
+        names = list_modules(bundle)
+    if not names:
+        return []
+
+    directory = tempfile.mkdtemp(prefix="inline-importer-check-")
+    try:
+        if zipfile.is_zipfile(bundle):
+            path, prefix = os.path.abspath(bundle), ""
+        else:
+            with open(bundle, "r", encoding="utf-8") as f:
+                source = f.read()
+            if ENTRYPOINT_MARKER not in source:
+                raise InlinerException("{!r} is not a script built by the builder: no entrypoint found".format(bundle))
+
+            # Preloading would import every module along with the importer, and hide the module being checked.
+            source = source.partition(ENTRYPOINT_MARKER)[0].replace("\nInlineImporter.preload()\n", "\n")
+
+            path, prefix = directory, _PREFIX_MODULE
+            with open(os.path.join(directory, _PREFIX_MODULE + ".py"), "w", encoding="utf-8") as f:
+                f.write(source)
+
+        jobs = min(jobs or os.cpu_count() or 1, len(names))
+        if hasattr(os, "fork"):
+            # Interleaved, so that the packages at the top of the bundle are spread over the workers.
+            chunks = [names[i::jobs] for i in range(jobs)]
+        else:
+            chunks = [[name] for name in names]
+
+        with ThreadPoolExecutor(jobs) as executor:
+            checked = executor.map(lambda chunk: _run_worker(path, prefix, chunk, python, timeout), chunks)
+            results = {result.name: result for chunk_results in checked for result in chunk_results}
+
+        return [results[name] for name in names]
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
@@ -0,0 +1,206 @@
+"""Per-module delta updates between two versions of a bundle script.
+
+A patch records the modules that were added, removed or changed between two bundles, rather than a byte-level diff.
+Everything outside of the modules (the importer, the entrypoint, ...) forms the *frame* of the bundle, and is only
+included in the patch if it changed. Applying a patch re-renders the modules with the builder, so it rebuilds the new
+bundle byte for byte, which is verified against the SHA-256 fingerprint of the new bundle stored in the patch.
+"""
+
+import ast
+import hashlib
+import json
+import sys
+import zlib
+from collections import namedtuple
+from io import StringIO
+
+from inline_importer import InlinerException
+from inline_importer.builder import write_modules
+from inline_importer.inliner import Repository
+
+PATCH_MAGIC = b"inline-importer-patch 1\n"
+"""The header of patch files, followed by the zlib-compressed JSON patch.
+"""
+
+Bundle = namedtuple("Bundle", "before modules after payload_format")
+"""A named tuple representing a bundle script split around its modules.
+
+``before`` and ``after`` are the frame of the bundle, ``modules`` is a `~inline_importer.inliner.Repository` and
+``payload_format`` is the format the modules are stored in (see `~inline_importer.builder.build_file`).
+"""
+
+
+def fingerprint(data):
+    # type: (bytes) -> str
+    """Return the content fingerprint (hex SHA-256) of a bundle."""
+    return hashlib.sha256(data).hexdigest()
+
+
+def render_bundle(bundle):
+    # type: (Bundle) -> bytes
+    """Render a bundle back to the contents of a script."""
+    with StringIO() as f:
+        f.write(bundle.before)
+        write_modules(f, bundle.modules, bundle.payload_format)
+        f.write(bundle.after)
+        return f.getvalue().encode("utf-8")
+
+
+def parse_bundle(data):
+    # type: (bytes) -> Bundle
+    """Split the contents of a bundle script around its modules.
+
+    Args:
+        data (bytes): the contents of the bundle
+
+    Returns:
+        `Bundle`: the split bundle
+
+    Raises:
+        `~inline_importer.InlinerException`: If data is not a bundle built by the builder, i.e. rendering its modules
+        back does not give the same contents.
+    """
+    if sys.version_info < (3, 8):
+        raise InlinerException("Delta updates require python 3.8 or newer")
+
+    try:
+        text = data.decode("utf-8")
+        tree = ast.parse(text)
+    except (UnicodeDecodeError, SyntaxError) as e:
+        raise InlinerException("Unable to parse bundle: {}".format(e))
+
+    nodes = {}
+    for node in tree.body:
+        if isinstance(node, ast.Assign) and len(node.targets) == 1:
+            target = node.targets[0]
+            if (
+                isinstance(target, ast.Attribute)
+                and target.attr in ("inlined_modules", "payload")
+                and getattr(target.value, "id", None) == "InlineImporter"
+            ):
+                nodes[target.attr] = node
+
+    if "inlined_modules" not in nodes:
+        raise InlinerException("Not an inlined bundle: no inlined modules found")
+
+    first = nodes.get("payload", nodes["inlined_modules"])
+    last = nodes["inlined_modules"]
+    # ast counts lines on "\n", whereas str.splitlines would also split on form feeds and other separators.
+    lines = text.split("\n")
+    before = "".join(line + "\n" for line in lines[:first.lineno - 1])
+    after = "\n".join(lines[last.end_lineno:])
+
+    inlined = ast.literal_eval(last.value)
+    modules = Repository()
+    if "payload" in nodes:
+        payload_format = "blob"
+        payload = ast.literal_eval(nodes["payload"].value)
+        for name, (is_package, (offset, length)) in inlined.items():
+            modules.insert_module(name, payload[offset:offset + length].decode("utf-8"), is_package)
+    else:
+        payload_format = "dict"
+        for name, (is_package, source) in inlined.items():
+            modules.insert_module(name, source, is_package)
+
+    bundle = Bundle(before, modules, after, payload_format)
+    if render_bundle(bundle) != data:
+        raise InlinerException("Bundle was not produced by the builder, or was modified after being built")
+
+    return bundle
+
+
+def diff_bundles(old, new):
+    # type: (bytes, bytes) -> bytes
+    """Build a patch turning the old bundle into the new one.
+
+    Args:
+        old (bytes): the contents of the old bundle
+        new (bytes): the contents of the new bundle
+
+    Returns:
+        bytes: the patch
+
+    Raises:
+        `~inline_importer.InlinerException`: If either bundle cannot be parsed (see `parse_bundle`).
+    """
+    old_bundle = parse_bundle(old)
+    new_bundle = parse_bundle(new)
+
+    removed = [name for name in old_bundle.modules if name not in new_bundle.modules]
+    modules = {
+        name: [module_def.is_package, module_def.source]
+        for name, module_def in new_bundle.modules.items()
+        if old_bundle.modules.get(name) != module_def
+    }
+
+    # The order only needs to be recorded if it cannot be derived from the old order
+    order = list(new_bundle.modules)
+    derived = [name for name in old_bundle.modules if name in new_bundle.modules]
+    derived += sorted(name for name in new_bundle.modules if name not in old_bundle.modules)
+
+    frame = None
+    if (old_bundle.before, old_bundle.after) != (new_bundle.before, new_bundle.after):
+        frame = [new_bundle.before, new_bundle.after]
+
+    patch = {
+        "old": fingerprint(old),
+        "new": fingerprint(new),
+        "payload_format": new_bundle.payload_format,
+        "frame": frame,
+        "removed": removed,
+        "modules": modules,
+        "order": order if order != derived else None,
+    }
+
+    return PATCH_MAGIC + zlib.compress(json.dumps(patch, sort_keys=True).encode("utf-8"), 9)
+
+
+def apply_patch(old, patch):
+    # type: (bytes, bytes) -> bytes
+    """Rebuild the new bundle from the old bundle and a patch.
+
+    Args:
+        old (bytes): the contents of the old bundle
+        patch (bytes): the patch, as returned by `diff_bundles`
+
+    Returns:
+        bytes: the contents of the new bundle
+
+    Raises:
+        `~inline_importer.InlinerException`: If the patch is invalid, was not made for the old bundle, or if the result
+        does not match the fingerprint of the new bundle.
+    """
+    if not patch.startswith(PATCH_MAGIC):
+        raise InlinerException("Not an inline-importer patch")
+
+    try:
+        patch = json.loads(zlib.decompress(patch[len(PATCH_MAGIC):]).decode("utf-8"))
+    except (zlib.error, ValueError) as e:
+        raise InlinerException("Corrupted patch: {}".format(e))
+
+    if fingerprint(old) != patch["old"]:
+        raise InlinerException("The patch does not apply to this bundle")
+
+    old_bundle = parse_bundle(old)
+
+    order = patch["order"]
+    if order is None:
+        removed = set(patch["removed"])
+        order = [name for name in old_bundle.modules if name not in removed]
+        order += sorted(name for name in patch["modules"] if name not in old_bundle.modules)
+
+    modules = Repository()
+    for name in order:
+        if name in patch["modules"]:
+            is_package, source = patch["modules"][name]
+            modules.insert_module(name, source, is_package)
+        else:
+            modules[name] = old_bundle.modules[name]
+
+    before, after = patch["frame"] or (old_bundle.before, old_bundle.after)
+    new = render_bundle(Bundle(before, modules, after, patch["payload_format"]))
+
+    if fingerprint(new) != patch["new"]:
+        raise InlinerException("The patched bundle does not match the fingerprint of the new bundle")
+
+    return new
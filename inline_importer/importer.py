@@ -1,16 +1,54 @@
+import builtins as _builtins
+import gc as _gc
 import os as _os
+import re as _re
 import sys as _sys
-from functools import lru_cache as _lru_cache
+from _thread import allocate_lock as _allocate_lock
+from collections import namedtuple as _namedtuple
+from importlib import import_module as _import_module, reload as _reload
 from importlib.abc import ExecutionLoader, MetaPathFinder
 from importlib.machinery import ModuleSpec
 
+_ModuleNotFoundError = getattr(_builtins, "ModuleNotFoundError", ImportError)
+
 
 class InlineImporter(ExecutionLoader, MetaPathFinder):
-    """Implements at the class level both PEP 302's ``Finder`` and ``Loader`` protocols."""
+    """Implements at the class level both PEP 302's ``Finder`` and ``Loader`` protocols.
+
+    The importer is safe to use from multiple threads, including on free-threaded builds. Cached filenames are plain
+    dictionary reads, validated against the current ``inlined_modules`` entry, and take no lock. Compiling a module is
+    guarded by a lock per module, so concurrent first imports decode and compile each module only once. Code objects
+    are not cached beyond that: the compilation is forgotten as soon as every concurrent caller got its result.
+
+    Caches belong to the class they are used on, so subclasses with other modules never share them.
+    """
 
     version = None
     inlined_modules = {}
     namespace_packages = False
+    distributions = {}
+    payload = None
+    stdlib_modules = frozenset()
+    stdlib_version = None
+    absent_modules = frozenset()
+    probe_absent = bool(_os.environ.get("INLINE_IMPORTER_PROBE_ABSENT"))
+
+    _stdlib_path = _os.path.dirname(getattr(_os, "__file__", None) or "")
+
+    _distribution_class = None
+    _guard = _allocate_lock()
+    _filenames = None
+    _compiling = None
+
+    # The attributes a bundle script may set besides its modules, with their values when left unset.
+    _bundle_defaults = {
+        "stdlib_modules": frozenset(),
+        "stdlib_version": None,
+        "absent_modules": frozenset(),
+        "distributions": {},
+    }
+
+    ReloadReport = _namedtuple("ReloadReport", "changed added removed reloaded")
 
     @classmethod
     def find_spec(cls, fullname, path=None, target=None):
@@ -18,16 +56,31 @@ class InlineImporter(ExecutionLoader, MetaPathFinder):
         
         Because we only deal with our inlined module, we don't have to care about path or target.
         The import machinery also takes care of fully resolving all names, so we just have to deal with the fullnames.
+
+        Modules in ``absent_modules`` were found missing when building, so ModuleNotFoundError is raised for them right
+        away, unless ``probe_absent`` is set (or the ``INLINE_IMPORTER_PROBE_ABSENT`` environment variable).
         """
         if fullname in cls.inlined_modules:
+            is_stdlib = fullname in cls.stdlib_modules
+            if is_stdlib and cls.stdlib_version != (_sys.implementation.name, _sys.hexversion):
+                # The inlined standard library was taken from another interpreter, use this interpreter's own.
+                return None
+
             # We have inlined this module, so return the spec
             ms = ModuleSpec(fullname, cls, origin=cls.get_filename(fullname), is_package=cls.is_package(fullname))
             ms.has_location = True
-            if cls.namespace_packages and ms.submodule_search_locations is not None:
+            if is_stdlib and ms.submodule_search_locations is not None:
+                # Submodules that were not inlined are still found in the standard library.
+                ms.submodule_search_locations.append(_os.path.dirname(ms.origin))
+            elif cls.namespace_packages and ms.submodule_search_locations is not None:
                 for p in _sys.path:
                     ms.submodule_search_locations.append(_os.path.join(p, _os.path.dirname(ms.origin)))
             return ms
 
+        if fullname in cls.absent_modules and not cls.probe_absent:
+            # Known to be missing at build time: fail now, rather than after every other finder and sys.path entry.
+            raise _ModuleNotFoundError("No module named {!r}".format(fullname), name=fullname)
+
         return None
 
     @staticmethod
@@ -58,34 +111,61 @@ class InlineImporter(ExecutionLoader, MetaPathFinder):
         cls._call_with_frames_removed(exec, code, module.__dict__)
 
     @classmethod
-    @_lru_cache(maxsize=None)
+    def _own(cls, name):
+        """Return the dictionary attribute name of cls itself (not of a base class), creating it if needed."""
+        value = cls.__dict__.get(name)
+        if value is None:
+            with cls._guard:
+                value = cls.__dict__.get(name)
+                if value is None:
+                    value = {}
+                    setattr(cls, name, value)
+
+        return value
+
+    @classmethod
+    def _get_entry(cls, fullname):
+        """Return the inlined_modules entry of fullname.
+
+        The dictionary is read once, so the entry is consistent even if ``reload_bundle`` swaps it concurrently.
+        Raises ImportError if the module cannot be found.
+        """
+        entry = cls.inlined_modules.get(fullname)
+        if entry is None:
+            raise ImportError
+
+        return entry
+
+    @classmethod
     def get_filename(cls, fullname):
         """Method to return the generated filename for fullname. 
 
         Raises ImportError if the module cannot be found.
         """
-        if fullname not in cls.inlined_modules:
-            raise ImportError
+        entry = cls._get_entry(fullname)
+        filenames = cls._own("_filenames")
+        cached = filenames.get(fullname)
+        if cached is not None and cached[0] is entry:
+            return cached[1]
 
-        mod = cls.inlined_modules[fullname]
         origin = fullname
-        if mod[0]:
+        if entry[0]:
             origin = ".".join([origin, "__init__"])
         origin = ".".join([origin.replace(".", "/"), "py"])
+        if fullname in cls.stdlib_modules:
+            # Inlined standard library modules keep the path of their original file.
+            origin = _os.path.join(cls._stdlib_path, origin)
 
+        filenames[fullname] = (entry, origin)
         return origin
 
     @classmethod
-    @_lru_cache(maxsize=None)
     def is_package(cls, fullname):
         """Method to return whether fullname is a package.
 
         Raise ImportError if the module cannot be found.
         """
-        if fullname not in cls.inlined_modules:
-            raise ImportError
-
-        return cls.inlined_modules[fullname][0]
+        return cls._get_entry(fullname)[0]
 
     @classmethod
     def get_source(cls, fullname):
@@ -93,10 +173,63 @@ class InlineImporter(ExecutionLoader, MetaPathFinder):
 
         Raise ImportError if the module cannot be found.
         """
-        if fullname not in cls.inlined_modules:
-            raise ImportError
+        return cls._entry_source(cls._get_entry(fullname))
 
-        return cls.inlined_modules[fullname][1]
+    @classmethod
+    def _entry_source(cls, entry):
+        """Return the source of an inlined_modules entry.
+
+        In payload mode, the entry holds the (offset, length) of the UTF-8 source in the payload instead of the source.
+        Entries swapped in by ``reload_bundle`` hold (offset, length, payload), so that they never get resolved against
+        the payload of another bundle.
+        """
+        source = entry[1]
+        if isinstance(source, tuple):
+            offset, length = source[:2]
+            payload = source[2] if len(source) > 2 else cls.payload
+            return str(memoryview(payload)[offset:offset + length], "utf-8")
+
+        return source
+
+    @staticmethod
+    def pack_payload(inlined_modules):
+        """Pack the sources of inlined_modules into a single bytes payload.
+
+        Returns the payload, and the inlined_modules dictionary referencing it.
+        """
+        chunks = []
+        packed = {}
+        offset = 0
+
+        for name, (is_package, source) in inlined_modules.items():
+            data = source.encode("utf-8")
+            chunks.append(data)
+            packed[name] = (is_package, (offset, len(data)))
+            offset += len(data)
+
+        return b"".join(chunks), packed
+
+    @classmethod
+    def preload(cls, names=None, freeze=True):
+        """Import inlined modules ahead of time, e.g. in the master process of a pre-fork server.
+
+        With freeze, every object alive after preloading is moved to the permanent generation of the garbage collector
+        (``gc.freeze``, python 3.7+), so collections in forked workers don't write to, and unshare, their memory pages.
+
+        Args:
+            names: the modules to import. Defaults to all the inlined modules, except the standard library ones, which
+                may only work on other platforms (e.g. ``asyncio.windows_events``) and are imported as needed anyway
+            freeze: whether to freeze the garbage collector after preloading
+        """
+        if names is None:
+            names = [name for name in cls.inlined_modules if name not in cls.stdlib_modules]
+
+        for name in names:
+            _import_module(name)
+
+        if freeze and hasattr(_gc, "freeze"):
+            _gc.collect()
+            _gc.freeze()
 
     @classmethod
     def get_code(cls, fullname):
@@ -105,12 +238,244 @@ class InlineImporter(ExecutionLoader, MetaPathFinder):
         Should return None if not applicable (e.g. built-in module).
         Raise ImportError if the module cannot be found.
         """
-        source = cls.get_source(fullname)
-        if source is None:
-            return None
+        entry = cls._get_entry(fullname)
+        compiling = cls._own("_compiling")
+
+        # A compilation is [entry, lock, result, callers], shared by the concurrent callers for the same entry.
+        with cls._guard:
+            job = compiling.get(fullname)
+            if job is None or job[0] is not entry:
+                job = compiling[fullname] = [entry, _allocate_lock(), None, 0]
+            job[3] += 1
+
         try:
-            path = cls.get_filename(fullname)
-        except ImportError:
-            return cls.source_to_code(source)
+            with job[1]:
+                # Another thread may have compiled the module while we were waiting for the lock.
+                if job[2] is None:
+                    source = cls._entry_source(entry)
+                    code = None if source is None else cls.source_to_code(source, cls.get_filename(fullname))
+                    job[2] = (code,)
+                return job[2][0]
+        finally:
+            with cls._guard:
+                job[3] -= 1
+                # The last caller forgets the compilation, so code objects are not kept alive by the importer.
+                if not job[3] and compiling.get(fullname) is job:
+                    del compiling[fullname]
+
+    @staticmethod
+    def normalize_distribution_name(name):
+        """Normalize a distribution name the way ``importlib.metadata`` does when matching distributions."""
+        return _re.sub(r"[-_.]+", "_", name).lower()
+
+    @classmethod
+    def find_distributions(cls, context=None):
+        """Find the inlined distributions matching context.
+
+        This is the ``importlib.metadata`` hook for ``MetaPathFinder`` objects. The distribution metadata is captured
+        at build time, so the lookup is a read from the distributions dictionary rather than a scan of ``sys.path``.
+        """
+        if not cls.distributions:
+            return iter(())
+
+        name = getattr(context, "name", None)
+        if name is None:
+            names = list(cls.distributions)
         else:
-            return cls.source_to_code(source, path)
+            names = [cls.normalize_distribution_name(name)]
+
+        distribution_class = cls.get_distribution_class()
+        return iter([distribution_class(cls.distributions[n]) for n in names if n in cls.distributions])
+
+    @classmethod
+    def get_distribution_class(cls):
+        """Return the ``importlib.metadata.Distribution`` subclass wrapping the inlined metadata.
+
+        The class is created on first use so that ``importlib.metadata`` is only imported when metadata is requested.
+        """
+        if InlineImporter._distribution_class is None:
+            from importlib.metadata import Distribution
+            from pathlib import PurePosixPath
+
+            class InlinedDistribution(Distribution):
+                def __init__(self, files):
+                    self._files = files
+
+                def read_text(self, filename):
+                    return self._files.get(filename)
+
+                def locate_file(self, path):
+                    return PurePosixPath(path)
+
+            InlineImporter._distribution_class = InlinedDistribution
+
+        return InlineImporter._distribution_class
+
+    @staticmethod
+    def read_bundle_attributes(filename):
+        """Read the importer attributes set by a bundle script, without executing it.
+
+        Returns a dictionary of ``inlined_modules``, with the sources unpacked from the payload if the bundle has one,
+        and of the ``stdlib_modules``, ``stdlib_version``, ``absent_modules`` and ``distributions`` the bundle sets.
+        """
+        import ast
+
+        with open(filename, "rb") as f:
+            tree = ast.parse(f.read(), filename)
+
+        attributes = {}
+        for node in tree.body:
+            if not isinstance(node, ast.Assign) or len(node.targets) != 1:
+                continue
+            target = node.targets[0]
+            if (
+                isinstance(target, ast.Attribute)
+                and (target.attr in ("inlined_modules", "payload") or target.attr in InlineImporter._bundle_defaults)
+                and isinstance(target.value, ast.Name)
+                and target.value.id == "InlineImporter"
+            ):
+                value = node.value
+                if isinstance(value, ast.Call) and getattr(value.func, "id", None) == "frozenset":
+                    attributes[target.attr] = frozenset(ast.literal_eval(value.args[0]) if value.args else ())
+                else:
+                    attributes[target.attr] = ast.literal_eval(value)
+
+        if "inlined_modules" not in attributes:
+            raise ImportError("{!r} is not an inlined bundle".format(filename))
+
+        payload = attributes.pop("payload", None)
+        if payload is not None:
+            attributes["inlined_modules"] = {
+                name: (is_package, payload[offset:offset + length].decode("utf-8"))
+                for name, (is_package, (offset, length)) in attributes["inlined_modules"].items()
+            }
+
+        return attributes
+
+    @staticmethod
+    def read_bundle(filename):
+        """Read the inlined modules of a bundle script, without executing it.
+
+        Returns a dictionary in the format of ``inlined_modules``, with the sources unpacked from the payload if the
+        bundle has one.
+        """
+        return InlineImporter.read_bundle_attributes(filename)["inlined_modules"]
+
+    @classmethod
+    def _dependencies(cls, fullname, inlined_modules):
+        """Return the inlined modules imported by fullname, according to its source."""
+        import ast
+
+        is_package, source = inlined_modules[fullname]
+        package = fullname if is_package else fullname.rpartition(".")[0]
+        dependencies = set()
+
+        for node in ast.walk(ast.parse(source)):
+            if isinstance(node, ast.Import):
+                names = [alias.name for alias in node.names]
+            elif isinstance(node, ast.ImportFrom):
+                base = node.module or ""
+                if node.level:
+                    parent = package.rsplit(".", node.level - 1)[0] if node.level > 1 else package
+                    base = ".".join(part for part in (parent, base) if part)
+                names = [base] + [".".join([base, alias.name]) for alias in node.names]
+            else:
+                continue
+
+            for name in names:
+                # Importing a submodule imports all of its parent packages.
+                parts = name.split(".")
+                for i in range(1, len(parts) + 1):
+                    dependencies.add(".".join(parts[:i]))
+
+        dependencies.discard(fullname)
+        return dependencies.intersection(inlined_modules)
+
+    @classmethod
+    def reload_bundle(cls, bundle):
+        """Swap the inlined modules for those of a new bundle, and reload the modules that changed.
+
+        Modules are compared by the hash of their source. Of the modules that were already imported, the ones that
+        changed, and the ones that import them (directly or not), are reloaded with ``importlib.reload``, dependencies
+        first. Modules that were not imported yet will simply be loaded from the new bundle.
+
+        The new modules are in place before reloading starts, so if a reload raises, the remaining modules will be
+        loaded from the new bundle on their next import.
+
+        A bundle script also replaces ``stdlib_modules``, ``stdlib_version``, ``absent_modules`` and ``distributions``
+        (reset to their defaults if the new bundle leaves them unset), right before the modules.
+
+        Args:
+            bundle: either the filename of a bundle script, or a dictionary in the format of ``inlined_modules``
+
+        Returns:
+            ReloadReport: the names of the changed, added, removed and reloaded modules
+        """
+        from hashlib import sha256
+
+        if isinstance(bundle, str):
+            attributes = cls.read_bundle_attributes(bundle)
+            inlined_modules = attributes.pop("inlined_modules")
+        else:
+            attributes, inlined_modules = None, bundle
+
+        def fingerprint(entry):
+            return entry[0], sha256(cls._entry_source(entry).encode("utf-8")).digest()
+
+        previous = cls.inlined_modules
+        changed = sorted(
+            name
+            for name in inlined_modules
+            if name in previous and fingerprint(previous[name]) != fingerprint(inlined_modules[name])
+        )
+        added = sorted(set(inlined_modules).difference(previous))
+        removed = sorted(set(previous).difference(inlined_modules))
+
+        if attributes is not None:
+            for name, default in cls._bundle_defaults.items():
+                setattr(cls, name, attributes.get(name, default))
+
+        if cls.payload is not None:
+            # Swapping payload and inlined_modules separately would let a concurrent import slice one with the offsets
+            # of the other. The builder's payload is left in place for the entries still being read by other threads.
+            payload, packed = cls.pack_payload(inlined_modules)
+            cls.inlined_modules = {
+                name: (is_package, location + (payload,)) for name, (is_package, location) in packed.items()
+            }
+        else:
+            cls.inlined_modules = inlined_modules
+
+        loaded = [
+            name
+            for name in inlined_modules
+            if name in _sys.modules and getattr(_sys.modules[name].__spec__, "loader", None) is cls
+        ]
+        dependencies = {name: cls._dependencies(name, inlined_modules) for name in loaded}
+
+        # Collect the changed modules and their dependents
+        stale = set(changed).intersection(loaded)
+        grew = True
+        while grew:
+            dependents = {name for name in loaded if dependencies[name] & stale}
+            grew = not dependents.issubset(stale)
+            stale.update(dependents)
+
+        # Order them so that dependencies are reloaded before their dependents
+        order = []
+        visiting = set()
+
+        def visit(name):
+            if name in order or name in visiting:
+                return
+            visiting.add(name)
+            for dependency in sorted(dependencies[name] & stale):
+                visit(dependency)
+            order.append(name)
+
+        for name in sorted(stale):
+            visit(name)
+
+        for name in order:
+            _reload(_sys.modules[name])
+
+        return cls.ReloadReport(changed, added, removed, order)
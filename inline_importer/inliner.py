@@ -1,14 +1,33 @@
+import _imp
+import ast
 import inspect
+import io
+import json
 import os
+import subprocess
+import sys
+import sysconfig
+import tarfile
+import tokenize
+import zipfile
 from collections import namedtuple
 from importlib.util import find_spec
 
 from inline_importer import InlinerException
+from inline_importer.importer import InlineImporter
+
+DISTRIBUTION_FILES = ("METADATA", "PKG-INFO", "entry_points.txt", "top_level.txt")
+"""The metadata files captured from a distribution when inlining it.
+"""
 
 ModuleDefinition = namedtuple("ModuleDefinition", "name is_package source")
 """A named tuple that represents a module's definition during inlining.
 """
 
+PendingModule = namedtuple("PendingModule", "name is_package path")
+"""A named tuple that represents a module that was found but not read yet.
+"""
+
 
 def get_file_source(filename):
     # type: (str) -> str
@@ -131,6 +150,24 @@ def extract_package_name(path):
     return base
 
 
+def read_module(pending):
+    # type: (Union[PendingModule, ModuleDefinition]) -> ModuleDefinition
+    """Read the source of a pending module.
+
+    Modules that were already read (e.g. from an archive) are returned unchanged.
+
+    Args:
+        pending (`~PendingModule` or `~ModuleDefinition`): the module to read
+
+    Returns:
+        `~ModuleDefinition`: The definition of the module.
+    """
+    if isinstance(pending, ModuleDefinition):
+        return pending
+
+    return ModuleDefinition(pending.name, pending.is_package, get_file_source(pending.path))
+
+
 class Repository(dict):
     """Repository contains the modules being inlined.
 
@@ -157,26 +194,26 @@ class Repository(dict):
         self[name] = ModuleDefinition(name, is_package, source)
 
 
-def build_inlined(modules, packages):
-    # type: (List[str], List[str]) -> Repository
-    """Builds a `~Repository` of inlined modules and packages.
+def find_modules(modules, packages):
+    # type: (List[str], List[str]) -> List[PendingModule]
+    """Find the modules and packages to inline, without reading them.
 
     Args:
         modules (list(str)): A list of paths to individual modules to inline.
         packages (list(str)): A list of paths to packages to recursively inline.
 
     Returns:
-        `~Repository`: A repository of inlined modules and packages.
+        list(`~PendingModule`): The modules to inline, in the order they should be inserted in the repository.
 
     Raises:
         `~inline_importer.InlinerException`: If an entry in `packages` is not a valid python package.
     """
 
-    inlined = Repository()
+    found = []
 
     for module_file in modules:
         # Technically you can import a module named "__init__", but you probably didn't mean to.
-        inlined.insert_module(extract_module_name(module_file), get_file_source(module_file), False)
+        found.append(PendingModule(extract_module_name(module_file), False, module_file))
 
     for root_package_path in packages:
         _orig_package_path = root_package_path
@@ -207,6 +244,466 @@ def build_inlined(modules, packages):
                 if not is_package:
                     name = ".".join([name, extract_module_name(module_file)])
 
-                inlined.insert_module(name, get_file_source(path), is_package)
+                found.append(PendingModule(name, is_package, path))
+
+    return found
+
+
+def decode_source(data):
+    # type: (bytes) -> str
+    """Decode the source of a module, honouring its encoding declaration (**PEP 263**) and normalizing newlines.
+
+    Args:
+        data (bytes): the raw contents of the module
+
+    Returns:
+        str: the source of the module
+    """
+    encoding, _ = tokenize.detect_encoding(io.BytesIO(data).readline)
+    with io.TextIOWrapper(io.BytesIO(data), encoding) as f:
+        return f.read()
+
+
+def iter_archive_sources(archive):
+    # type: (Union[str, BinaryIO]) -> Iterator[Tuple[str, str]]
+    """Iterate over the python sources contained in an archive, without extracting it.
+
+    Zip archives (including wheels) are read from their central directory. Other archives are read as a stream of tar
+    members (optionally gzip, bzip2 or xz compressed), which also works for non-seekable inputs such as the output of
+    ``git archive``. Only the members ending in ``.py`` are read.
+
+    Args:
+        archive (str or binary file-like object): the path of the archive, ``-`` for the standard input, or an open
+            tar stream.
+
+    Yields:
+        tuple(str, str): The path of each python member and its source.
+
+    Raises:
+        `~inline_importer.InlinerException`: If the archive cannot be read.
+    """
+    try:
+        if isinstance(archive, str) and archive != "-" and zipfile.is_zipfile(archive):
+            with zipfile.ZipFile(archive) as z:
+                for info in z.infolist():
+                    if not info.is_dir() and info.filename.endswith(".py"):
+                        yield info.filename, decode_source(z.read(info))
+            return
+
+        if archive == "-":
+            tar = tarfile.open(fileobj=sys.stdin.buffer, mode="r|*")
+        elif isinstance(archive, str):
+            tar = tarfile.open(archive, mode="r|*")
+        else:
+            tar = tarfile.open(fileobj=archive, mode="r|*")
+
+        with tar:
+            for member in tar:
+                if member.isfile() and member.name.endswith(".py"):
+                    yield member.name, decode_source(tar.extractfile(member).read())
+    except (tarfile.TarError, zipfile.BadZipFile, OSError, SyntaxError, UnicodeDecodeError) as e:
+        raise InlinerException("Unable to read archive {!r}: {}".format(archive, e))
+
+
+def find_archive_modules(archive, root=""):
+    # type: (Union[str, BinaryIO], str) -> List[ModuleDefinition]
+    """Find the modules and packages contained in an archive.
+
+    Paths are taken relative to root. Python files at the top of root are modules, and directories containing an
+    ``__init__.py`` are packages, along with their submodules and subpackages (like `build_inlined` does for the
+    packages it is given). Everything else is ignored.
+
+    Args:
+        archive (str or binary file-like object): the archive, as accepted by `iter_archive_sources`
+        root (str): the directory of the archive containing the modules and packages (e.g. ``project-1.0/src``)
+
+    Returns:
+        list(`~ModuleDefinition`): The modules, in the order they appear in the archive.
+
+    Raises:
+        `~inline_importer.InlinerException`: If the archive cannot be read.
+    """
+    prefix = root.strip("/")
+    if prefix:
+        prefix += "/"
+
+    sources = []
+    for path, source in iter_archive_sources(archive):
+        path = path[2:] if path.startswith("./") else path
+        if path.startswith(prefix):
+            sources.append((path[len(prefix):].split("/"), source))
+
+    package_dirs = {tuple(parts[:-1]) for parts, _ in sources if parts[-1] == "__init__.py" and len(parts) > 1}
+
+    found = []
+    for parts, source in sources:
+        dirs, filename = parts[:-1], parts[-1]
+        is_package = filename == "__init__.py"
+        if is_package and not dirs:
+            continue
+        if not all(tuple(dirs[:i]) in package_dirs for i in range(1, len(dirs) + 1)):
+            continue
+
+        names = dirs if is_package else dirs + [filename[:-3]]
+        if all(name.isidentifier() for name in names):
+            found.append(ModuleDefinition(".".join(names), is_package, source))
+
+    return found
+
+
+def build_inlined(modules, packages, pipeline=None, archives=()):
+    # type: (List[str], List[str], Optional[Pipeline], List[Union[str, Tuple[str, str]]]) -> Repository
+    """Builds a `~Repository` of inlined modules and packages.
+
+    Args:
+        modules (list(str)): A list of paths to individual modules to inline.
+        packages (list(str)): A list of paths to packages to recursively inline.
+        pipeline (`~inline_importer.pipeline.Pipeline`, optional): The pipeline the modules go through before being
+            inserted in the repository. By default, modules are only read.
+        archives (list(str or tuple(str, str))): A list of archives whose modules and packages should be inlined,
+            either as paths or as ``(path, root)`` tuples (see `find_archive_modules`).
+
+    Returns:
+        `~Repository`: A repository of inlined modules and packages.
+
+    Raises:
+        `~inline_importer.InlinerException`: If an entry in `packages` is not a valid python package.
+    """
+
+    found = find_modules(modules, packages)
+    for archive in archives:
+        archive, root = (archive, "") if isinstance(archive, str) else archive
+        found.extend(find_archive_modules(archive, root))
+
+    if pipeline is None:
+        module_defs = [read_module(pending) for pending in found]
+    else:
+        module_defs = pipeline.run(found)
+
+    inlined = Repository()
+    for module_def in module_defs:
+        inlined.insert_module(module_def.name, module_def.source, module_def.is_package)
 
     return inlined
+
+
+def get_distribution_files(name):
+    # type: (str) -> Dict[str, str]
+    """Read the metadata files of an installed distribution.
+
+    Only the files listed in `DISTRIBUTION_FILES` are captured, as they are the ones ``importlib.metadata`` reads to
+    answer ``version()``, ``metadata()`` and ``entry_points()``.
+
+    Args:
+        name (str): the name of the distribution (e.g. ``inline-importer``)
+
+    Returns:
+        dict(str, str): The contents of the metadata files, keyed by filename.
+
+    Raises:
+        `~inline_importer.InlinerException`: If the distribution is not installed, or ``importlib.metadata`` is not
+        available.
+    """
+    try:
+        from importlib import metadata
+    except ImportError:
+        raise InlinerException("Inlining distribution metadata requires importlib.metadata (python 3.8+)")
+
+    try:
+        distribution = metadata.distribution(name)
+    except metadata.PackageNotFoundError:
+        raise InlinerException("Distribution {!r} is not installed".format(name))
+
+    files = {}
+    for filename in DISTRIBUTION_FILES:
+        text = distribution.read_text(filename)
+        if text is not None:
+            files[filename] = text
+
+    return files
+
+
+def build_distributions(names):
+    # type: (List[str]) -> Dict[str, Dict[str, str]]
+    """Builds the index of inlined distribution metadata.
+
+    The index is keyed by normalized distribution name, so the importer can answer ``importlib.metadata`` lookups with
+    a single dictionary read.
+
+    Args:
+        names (list(str)): A list of installed distribution names.
+
+    Returns:
+        dict(str, dict(str, str)): The metadata files of each distribution, keyed by normalized distribution name.
+
+    Raises:
+        `~inline_importer.InlinerException`: If a distribution is not installed or is given twice.
+    """
+    distributions = {}
+
+    for name in names:
+        key = InlineImporter.normalize_distribution_name(name)
+        if key in distributions:
+            raise InlinerException("Distribution {!r} is already present in the index".format(name))
+
+        distributions[key] = get_distribution_files(name)
+
+    return distributions
+
+
+def find_module_imports(source, name="", is_package=False):
+    # type: (str, str, bool) -> Set[str]
+    """Find the modules imported when a module is executed.
+
+    Only the imports executed at import time are considered, i.e. imports inside functions are ignored. Relative
+    imports are resolved using the name of the module. Since ``from package import name`` can import a submodule, the
+    result includes ``package.name`` as a candidate, along with the parent packages of every imported module.
+
+    Args:
+        source (str): the source of the module
+        name (str): the fully qualified name of the module
+        is_package (bool): whether the module is a package
+
+    Returns:
+        set(str): the fully qualified names of the (candidate) imported modules
+
+    Raises:
+        `~inline_importer.InlinerException`: If the source cannot be parsed.
+    """
+    try:
+        tree = ast.parse(source)
+    except SyntaxError as e:
+        raise InlinerException("Unable to parse module {!r}: {}".format(name, e))
+
+    package = name if is_package else name.rpartition(".")[0]
+    imported = set()
+
+    todo = [tree]
+    while todo:
+        node = todo.pop()
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.Lambda)):
+            continue
+        todo.extend(ast.iter_child_nodes(node))
+
+        for imported_name in _imported_names(node, package):
+            parts = imported_name.split(".")
+            imported.update(".".join(parts[:i]) for i in range(1, len(parts) + 1) if all(parts[:i]))
+
+    return imported
+
+
+def _imported_names(node, package):
+    """Return the fully qualified names of the modules (candidates, for ``from`` imports) imported by a node."""
+    if isinstance(node, ast.Import):
+        return [alias.name for alias in node.names]
+
+    if isinstance(node, ast.ImportFrom):
+        base = node.module or ""
+        if node.level:
+            parent = package.rsplit(".", node.level - 1)[0] if node.level > 1 else package
+            base = ".".join(part for part in (parent, base) if part)
+        return [base] + [".".join([base, alias.name]) for alias in node.names if alias.name != "*"]
+
+    return []
+
+
+def _catches_import_error(handler):
+    """Whether an except clause catches ImportError."""
+    if handler.type is None:
+        return True
+
+    types = handler.type.elts if isinstance(handler.type, ast.Tuple) else [handler.type]
+    caught = ("ImportError", "ModuleNotFoundError", "Exception", "BaseException")
+    return any(getattr(t, "id", getattr(t, "attr", None)) in caught for t in types)
+
+
+def find_guarded_imports(source, name="", is_package=False):
+    # type: (str, str, bool) -> Set[str]
+    """Find the imports of a module guarded by a ``try`` statement catching ImportError.
+
+    These imports probe for optional modules, including inside functions. Relative imports are resolved using the
+    name of the module, and ``from package import name`` gives both ``package`` and ``package.name`` as candidates.
+    Since importing a module first imports its parent packages, the result includes the parents of every candidate.
+
+    Args:
+        source (str): the source of the module
+        name (str): the fully qualified name of the module
+        is_package (bool): whether the module is a package
+
+    Returns:
+        set(str): the fully qualified names of the (candidate) modules imported in guarded blocks
+
+    Raises:
+        `~inline_importer.InlinerException`: If the source cannot be parsed.
+    """
+    try:
+        tree = ast.parse(source)
+    except SyntaxError as e:
+        raise InlinerException("Unable to parse module {!r}: {}".format(name, e))
+
+    package = name if is_package else name.rpartition(".")[0]
+    guarded = set()
+
+    for node in ast.walk(tree):
+        if not isinstance(node, ast.Try) or not any(_catches_import_error(h) for h in node.handlers):
+            continue
+
+        for statement in node.body:
+            for child in ast.walk(statement):
+                for imported_name in _imported_names(child, package):
+                    parts = imported_name.split(".")
+                    guarded.update(".".join(parts[:i]) for i in range(1, len(parts) + 1) if all(parts[:i]))
+
+    return guarded
+
+
+def find_optional_imports(repository):
+    # type: (Union[Repository, Dict[str, ModuleDefinition]]) -> Set[str]
+    """Find the modules probed by guarded imports of a repository, that it does not provide itself.
+
+    Args:
+        repository (`~Repository` or dict(str, `~ModuleDefinition`)): the modules of the application
+
+    Returns:
+        set(str): the fully qualified names of the probed modules
+    """
+    probed = set()
+    for module_def in repository.values():
+        probed.update(find_guarded_imports(module_def.source, module_def.name, module_def.is_package))
+
+    return probed.difference(repository)
+
+
+_ABSENT_MODULES_SCRIPT = """
+import importlib.util, json, sys
+absent = []
+for name in json.load(sys.stdin):
+    parent, _, attribute = name.rpartition(".")
+    try:
+        if importlib.util.find_spec(name) is None:
+            absent.append(name)
+    except ImportError as e:
+        # Only a missing parent package makes the module absent, not a parent failing to import.
+        if e.name and (name + ".").startswith(e.name + "."):
+            absent.append(name)
+    except Exception:
+        pass
+    # "from parent import name" candidates naming an attribute of the (imported) parent are not modules.
+    if absent and absent[-1] == name and parent and hasattr(sys.modules.get(parent), attribute):
+        absent.pop()
+sys.stdout.write("\\n" + json.dumps(absent))
+"""
+
+
+def find_absent_modules(names, python=sys.executable):
+    # type: (Iterable[str], str) -> Set[str]
+    """Find which modules cannot be imported by a target interpreter.
+
+    The modules are looked up by running the target interpreter in isolated mode (``-I``), so that neither the current
+    directory nor ``PYTHONPATH`` can provide a module. Looking up a module imports its parent packages: modules whose
+    parent package is absent are not returned, since importing them fails on the parent already, and neither are
+    candidates that turn out to be attributes of their parent (e.g. ``json.loads``, for ``from json import loads``).
+
+    Args:
+        names (iterable(str)): the fully qualified names of the modules
+        python (str): the path of the target interpreter
+
+    Returns:
+        set(str): the fully qualified names of the absent modules
+
+    Raises:
+        `~inline_importer.InlinerException`: If the target interpreter cannot be run.
+    """
+    try:
+        result = subprocess.run(
+            [python, "-I", "-c", _ABSENT_MODULES_SCRIPT],
+            input=json.dumps(sorted(names)).encode("utf-8"),
+            stdout=subprocess.PIPE,
+            check=True,
+        )
+        absent = set(json.loads(result.stdout.decode("utf-8").splitlines()[-1]))
+    except (OSError, subprocess.CalledProcessError, ValueError, IndexError) as e:
+        raise InlinerException("Unable to look up modules with {!r}: {}".format(python, e))
+
+    return {
+        name for name in absent
+        if not any(".".join(name.split(".")[:i]) in absent for i in range(1, name.count(".") + 1))
+    }
+
+
+def find_stdlib_module(name):
+    # type: (str) -> Optional[Tuple[str, bool]]
+    """Locate the source of a pure-python standard library module, without importing it.
+
+    Built-in, frozen and extension modules are not pure-python, and are never returned.
+
+    Args:
+        name (str): the fully qualified name of the module
+
+    Returns:
+        tuple(str, bool): the path of the module's source and whether it is a package, or None if name is not a
+        pure-python standard library module.
+    """
+    if name.partition(".")[0] in sys.builtin_module_names or _imp.is_frozen(name):
+        return None
+
+    base = os.path.join(sysconfig.get_paths()["stdlib"], *name.split("."))
+    if os.path.isfile(base + ".py"):
+        return base + ".py", False
+
+    init = os.path.join(base, "__init__.py")
+    if os.path.isfile(init):
+        return init, True
+
+    return None
+
+
+def build_stdlib(repository, entrypoint="", names=()):
+    # type: (Union[Repository, Dict[str, ModuleDefinition]], str, List[str]) -> Repository
+    """Builds a `~Repository` of the pure-python standard library modules needed by an application.
+
+    The modules imported by the entrypoint and the inlined modules are analyzed, then the standard library modules
+    they import, and so on. As the analysis is static, it includes modules imported conditionally (e.g. only on
+    other platforms), but not modules imported inside functions; those can be given explicitly.
+
+    Args:
+        repository (`~Repository` or dict(str, `~ModuleDefinition`)): the modules of the application
+        entrypoint (str): the source code of the entrypoint
+        names (list(str)): additional standard library modules to inline, along with their dependencies
+
+    Returns:
+        `~Repository`: A repository of standard library modules, sorted by name.
+
+    Raises:
+        `~inline_importer.InlinerException`: If a module given in names is not a pure-python standard library module.
+    """
+    for name in names:
+        if find_stdlib_module(name) is None:
+            raise InlinerException("{!r} is not a pure-python standard library module".format(name))
+
+    todo = set(names).union(find_module_imports(entrypoint, "__main__"))
+    for module_def in repository.values():
+        todo.update(find_module_imports(module_def.source, module_def.name, module_def.is_package))
+
+    found = {}
+    seen = set()
+    while todo:
+        name = todo.pop()
+        seen.add(name)
+        if name in repository:
+            continue
+
+        location = find_stdlib_module(name)
+        if location is None:
+            continue
+
+        path, is_package = location
+        with open(path, "rb") as f:
+            found[name] = ModuleDefinition(name, is_package, decode_source(f.read()))
+        todo.update(find_module_imports(found[name].source, name, is_package).difference(seen))
+
+    stdlib = Repository()
+    for name in sorted(found):
+        stdlib[name] = found[name]
+
+    return stdlib
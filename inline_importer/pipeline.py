@@ -0,0 +1,203 @@
+"""Per-module build pipeline.
+
+Every module found by the inliner goes through the stages registered on a `Pipeline`, in registration order. A stage is
+a callable taking the module and returning it, most likely as a new `~inline_importer.inliner.ModuleDefinition`. The
+first stage receives the `~inline_importer.inliner.PendingModule` found by the inliner, which is why the default
+pipeline starts with `~inline_importer.inliner.read_module`.
+
+A stage can also return a `StageResult`, to attach a report about the module (e.g. what a transform changed). The
+reports are collected in `Pipeline.reports`.
+
+Modules are independent of each other, so the pipeline can spread them over a pool of worker processes. Stages must
+then be picklable: module-level functions, or `functools.partial` objects wrapping them.
+"""
+
+import time
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+from inline_importer import InlinerException
+from inline_importer.inliner import read_module
+from inline_importer.transforms import strip_typing
+
+StageStatistics = namedtuple("StageStatistics", "name calls seconds")
+"""A named tuple holding the number of modules that went through a stage, and the total time it took them.
+"""
+
+StageResult = namedtuple("StageResult", "item report")
+"""A named tuple a stage can return instead of the module, to attach a report to it. Empty reports are dropped.
+"""
+
+
+def compile_module(module_def):
+    # type: (ModuleDefinition) -> ModuleDefinition
+    """Validate a module by compiling its source.
+
+    Args:
+        module_def (`~inline_importer.inliner.ModuleDefinition`): the module to validate
+
+    Returns:
+        `~inline_importer.inliner.ModuleDefinition`: The module, unchanged.
+
+    Raises:
+        `~inline_importer.InlinerException`: If the source of the module is not valid python.
+    """
+    try:
+        compile(module_def.source, module_def.name, "exec", dont_inherit=True)
+    except (SyntaxError, ValueError) as e:
+        raise InlinerException("Module {!r} does not compile: {}".format(module_def.name, e))
+
+    return module_def
+
+
+def strip_typing_module(module_def, drop_annotations=False):
+    # type: (ModuleDefinition, bool) -> StageResult
+    """Remove the typing-only parts of a module (see `~inline_importer.transforms.strip_typing`).
+
+    Args:
+        module_def (`~inline_importer.inliner.ModuleDefinition`): the module to transform
+        drop_annotations (bool): whether to remove function annotations
+
+    Returns:
+        `StageResult`: The transformed module, reported with the list of modules it no longer imports.
+
+    Raises:
+        `~inline_importer.InlinerException`: If the source of the module cannot be parsed.
+    """
+    filename = "{}.py".format(module_def.name.replace(".", "/"))
+    result = strip_typing(module_def.source, drop_annotations, filename)
+
+    return StageResult(module_def._replace(source=result.source), result.removed_imports)
+
+
+def _run_stages(stages, item):
+    """Run item through every stage, returning the result, the time spent in each stage and the stage reports."""
+    timings = []
+    reports = []
+
+    for name, stage in stages:
+        start = time.perf_counter()
+        item = stage(item)
+        timings.append(time.perf_counter() - start)
+        if isinstance(item, StageResult):
+            item, report = item
+            if report:
+                reports.append((name, report))
+
+    return item, timings, reports
+
+
+class Pipeline:
+    """A pipeline of stages applied to every inlined module.
+
+    Args:
+        workers (int): the number of worker processes. With a single worker, modules are processed in this process.
+    """
+
+    def __init__(self, workers=1):
+        if workers < 1:
+            raise InlinerException("A pipeline needs at least one worker, got {!r}".format(workers))
+
+        self.workers = workers
+        self.stages = []
+        self.statistics = []
+        self.reports = {}
+
+    @classmethod
+    def default(cls, workers=1, validate=False, strip_typing=False, drop_annotations=False):
+        # type: (int, bool, bool, bool) -> Pipeline
+        """Create the pipeline used by the inliner, which reads, optionally transforms, then validates modules.
+
+        Args:
+            workers (int): the number of worker processes
+            validate (bool): whether to add a stage compiling each module, once transformed
+            strip_typing (bool): whether to add a ``transform`` stage removing the typing-only parts of each module
+            drop_annotations (bool): whether the ``transform`` stage also removes function annotations. Implies
+                strip_typing.
+
+        Returns:
+            `Pipeline`: the new pipeline
+        """
+        pipeline = cls(workers)
+        pipeline.register("read", read_module)
+        if strip_typing or drop_annotations:
+            pipeline.register("transform", strip_typing_module, drop_annotations=drop_annotations)
+        if validate:
+            pipeline.register("compile", compile_module)
+
+        return pipeline
+
+    def register(self, name, stage, *args, **kwargs):
+        """Append a stage to the pipeline.
+
+        Extra arguments are bound to the stage and passed after the module.
+
+        Args:
+            name (str): the name of the stage, used in the statistics
+            stage (callable): the stage
+            *args: positional arguments for the stage
+            **kwargs: keyword arguments for the stage
+
+        Raises:
+            `~inline_importer.InlinerException`: If a stage with the same name is already registered.
+        """
+        if any(name == registered for registered, _ in self.stages):
+            raise InlinerException("Stage {!r} is already registered".format(name))
+
+        if args or kwargs:
+            stage = partial(_bound_stage, stage, args, kwargs)
+
+        self.stages.append((name, stage))
+
+    def run(self, items):
+        # type: (List[PendingModule]) -> List[ModuleDefinition]
+        """Run every item through the stages.
+
+        The results are returned in the order of items, whatever the number of workers, so the output of a parallel
+        build is identical to the output of a serial build. The statistics of the run are stored in ``statistics``, and
+        the reports of the stages in ``reports``, keyed by stage name then module name.
+
+        Args:
+            items (list): the modules, as expected by the first stage
+
+        Returns:
+            list: the modules, as returned by the last stage
+        """
+        run = partial(_run_stages, self.stages)
+
+        if self.workers == 1 or len(items) < 2:
+            results = [run(item) for item in items]
+        else:
+            chunksize = max(1, len(items) // (self.workers * 4))
+            with ProcessPoolExecutor(self.workers) as executor:
+                results = list(executor.map(run, items, chunksize=chunksize))
+
+        calls = len(results)
+        self.statistics = [
+            StageStatistics(name, calls, sum(timings[i] for _, timings, _ in results))
+            for i, (name, _) in enumerate(self.stages)
+        ]
+
+        self.reports = {}
+        for item, _, reports in results:
+            for name, report in reports:
+                self.reports.setdefault(name, {})[item.name] = report
+
+        return [item for item, _, _ in results]
+
+    def format_statistics(self):
+        # type: () -> str
+        """Format the statistics of the last run, one stage per line.
+
+        Times are summed over all workers, so they can exceed the wall time of a parallel run.
+        """
+        return "\n".join(
+            "{:<16} {:>8} modules {:>10.3f}s".format(stats.name, stats.calls, stats.seconds)
+            for stats in self.statistics
+        )
+
+
+def _bound_stage(stage, args, kwargs, item):
+    """Call stage with the arguments bound at registration."""
+    return stage(item, *args, **kwargs)
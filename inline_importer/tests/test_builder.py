@@ -1,10 +1,14 @@
 import os
 import random
+import subprocess
+import sys
 import tempfile
+import zipfile
+from io import BytesIO
 from unittest import TestCase
 
-from inline_importer import builder
-from inline_importer.inliner import ModuleDefinition
+from inline_importer import builder, InlinerException
+from inline_importer.inliner import build_stdlib, find_absent_modules, find_optional_imports, ModuleDefinition
 
 
 class FakeFile:
@@ -38,6 +42,14 @@ class TestWriteFile(TestCase):
 
 # noinspection PyBroadException
 class TestBuildFile(TestCase):
+    def run_script(self, s):
+        """Run a built script in isolated mode, returning its output."""
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "inlined.py")
+            with open(path, "w") as f:
+                f.write(s)
+            return subprocess.check_output([sys.executable, "-I", path], universal_newlines=True)
+
     def test_build_file(self):
         s = builder.build_file({}, "")
 
@@ -62,6 +74,71 @@ class TestBuildFile(TestCase):
         except Exception:
             self.fail("compilation should be valid")
 
+    def test_build_file_distributions(self):
+        s = builder.build_file({}, "", distributions={"test": {"METADATA": "Name: test\nVersion: 1.0\n"}})
+
+        self.assertIn("InlineImporter.distributions = {", s)
+
+        try:
+            compile(s, "inlined.py", "exec", dont_inherit=True)
+        except Exception:
+            self.fail("compilation should be valid")
+
+    def test_build_file_blob(self):
+        hex_val = hex(random.getrandbits(128))[2:]
+        s = builder.build_file(
+            {"test": ModuleDefinition("test", False, "TEST_VALUE={!r}".format(hex_val))},
+            "import test\nprint(test.TEST_VALUE)\n",
+            payload_format="blob",
+            preload=True,
+        )
+
+        self.assertIn("InlineImporter.payload = (", s)
+        self.assertIn("InlineImporter.preload()", s)
+
+        self.assertEqual(self.run_script(s), hex_val + "\n")
+
+    def test_build_file_absent_modules(self):
+        entrypoint = "try:\n    import ujson\nexcept ImportError as e:\n    print(type(e).__name__, e.name)\n"
+        s = builder.build_file({}, entrypoint, absent_modules=["ujson", "simplejson"])
+
+        self.assertIn("InlineImporter.absent_modules = frozenset(['simplejson', 'ujson'])", s)
+
+        self.assertEqual(self.run_script(s), "ModuleNotFoundError ujson\n")
+
+    def test_build_file_absent_dotted_probe(self):
+        # A finder at the end of sys.meta_path records the lookups that were not short-circuited
+        entrypoint = (
+            "import sys\n"
+            "class Spy:\n"
+            "    seen = []\n"
+            "    @classmethod\n"
+            "    def find_spec(cls, name, path=None, target=None):\n"
+            "        cls.seen.append(name)\n"
+            "sys.meta_path.append(Spy)\n"
+            "try:\n"
+            "    import _inline_importer_nope.speedups\n"
+            "except ImportError as e:\n"
+            "    print(e.name, Spy.seen)\n"
+        )
+        modules = {"app": ModuleDefinition("app", False, entrypoint)}
+        absent = find_absent_modules(find_optional_imports(modules))
+        s = builder.build_file(modules, "import app\n", absent_modules=absent)
+
+        self.assertEqual(self.run_script(s), "_inline_importer_nope []\n")
+
+    def test_build_file_stdlib_preload(self):
+        # asyncio pulls in modules that only import on other platforms, e.g. asyncio.windows_events
+        entrypoint = "import asyncio\nprint(asyncio.__spec__.loader.__name__)\n"
+        stdlib = build_stdlib({}, entrypoint)
+        s = builder.build_file(stdlib, entrypoint, preload=True, stdlib_modules=list(stdlib))
+
+        self.assertEqual(self.run_script(s), "InlineImporter\n")
+
+    def test_build_file_unknown_payload(self):
+        with self.assertRaises(InlinerException):
+            builder.build_file({}, "", payload_format="unknown")
+
     def test_build_file_modules(self):
         hex_val = hex(random.getrandbits(128))[2:]
         s = builder.build_file(
@@ -88,3 +165,40 @@ class TestBuildFile(TestCase):
 
         with self.assertRaises(SyntaxError):
             compile(s, "inlined.py", "exec", dont_inherit=True)
+
+
+class TestBuildPyz(TestCase):
+    modules = {
+        "pkg": ModuleDefinition("pkg", True, "VALUE = 'package'\n"),
+        "pkg.sub": ModuleDefinition("pkg.sub", False, "from pkg import VALUE\nSUB = VALUE + '.sub'\n"),
+    }
+
+    def test_build_pyz(self):
+        with zipfile.ZipFile(BytesIO(builder.build_pyz(self.modules, "print('valid!')"))) as archive:
+            infos = archive.infolist()
+
+        self.assertEqual([i.filename for i in infos], ["__main__.py", "pkg/__init__.py", "pkg/sub.py"])
+        self.assertTrue(all(i.compress_type == zipfile.ZIP_STORED for i in infos))
+
+    def test_build_pyz_reproducible(self):
+        reversed_modules = dict(reversed(self.modules.items()))
+
+        self.assertEqual(builder.build_pyz(self.modules, ""), builder.build_pyz(reversed_modules, ""))
+
+    def test_build_pyz_precompile(self):
+        with zipfile.ZipFile(BytesIO(builder.build_pyz(self.modules, "", precompile=True))) as archive:
+            names = archive.namelist()
+
+        self.assertIn("pkg/__init__.pyc", names)
+        self.assertIn("pkg/sub.pyc", names)
+
+    def test_write_pyz_runs(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "app.pyz")
+            entrypoint = "import pkg.sub\nprint(pkg.sub.SUB, pkg.sub.__spec__.origin.endswith('.pyc'))\n"
+            builder.write_pyz(path, self.modules, entrypoint, shebang="#!/usr/bin/env python3", precompile=True)
+
+            self.assertTrue(os.access(path, os.X_OK), "zipapp with a shebang should be executable")
+            output = subprocess.check_output([sys.executable, "-I", path], universal_newlines=True)
+
+        self.assertEqual(output, "package.sub True\n")
@@ -0,0 +1,73 @@
+import os
+import tempfile
+from unittest import TestCase
+
+from inline_importer import builder, check, InlinerException
+from inline_importer.inliner import build_stdlib, Repository
+
+
+class TestCheck(TestCase):
+    def setUp(self) -> None:
+        self.repository = Repository()
+        self.repository.insert_module("app", "", True)
+        self.repository.insert_module("app.good", "import json\nprint('noise')\nVALUE = [0] * 100000\n")
+        self.repository.insert_module("app.sibling", "from app import missing\n")
+        self.repository.insert_module("app.data", "open(__file__.replace('data.py', 'data.txt'))\n")
+        self.repository.insert_module("app.exits", "import os\nos._exit(4)\n")
+
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def assert_results(self, results):
+        self.assertEqual([result.name for result in results], list(self.repository))
+
+        by_name = {result.name: result for result in results}
+        self.assertTrue(by_name["app"].ok)
+        self.assertTrue(by_name["app.good"].ok)
+        self.assertIsNone(by_name["app.good"].error)
+        self.assertGreater(by_name["app.good"].rss, 0)
+        self.assertIn("ImportError", by_name["app.sibling"].error)
+        self.assertIn("data.txt", by_name["app.data"].error)
+        self.assertFalse(by_name["app.exits"].ok)
+
+    def test_check_script(self):
+        path = os.path.join(self.directory.name, "bundle.py")
+        builder.write_file(path, self.repository, "import app.good\n", payload_format="blob", preload=True)
+
+        self.assertEqual(check.list_modules(path), list(self.repository))
+        self.assert_results(check.check_bundle(path, jobs=2))
+
+    def test_check_pyz(self):
+        path = os.path.join(self.directory.name, "bundle.pyz")
+        builder.write_pyz(path, self.repository, "import app.good\n")
+
+        self.assertEqual(sorted(check.list_modules(path)), sorted(self.repository))
+        self.assert_results(check.check_bundle(path, list(self.repository)))
+
+    def test_check_skips_stdlib(self):
+        stdlib = build_stdlib({}, "import asyncio\n")
+        modules = Repository(self.repository)
+        modules.update(stdlib)
+        path = os.path.join(self.directory.name, "bundle.py")
+        builder.write_file(path, modules, "import asyncio\n", stdlib_modules=list(stdlib))
+
+        self.assertIn("asyncio.windows_events", stdlib)
+        self.assertEqual(check.list_modules(path), list(self.repository))
+
+    def test_check_timeout(self):
+        self.repository.insert_module("app.slow", "import time\ntime.sleep(30)\n")
+        path = os.path.join(self.directory.name, "bundle.py")
+        builder.write_file(path, self.repository, "")
+
+        (result,) = check.check_bundle(path, ["app.slow"], timeout=1)
+
+        self.assertFalse(result.ok)
+        self.assertIn("timed out", result.error)
+
+    def test_check_not_a_bundle(self):
+        path = os.path.join(self.directory.name, "script.py")
+        with open(path, "w") as f:
+            f.write("print('not a bundle')\n")
+
+        with self.assertRaises(InlinerException):
+            check.check_bundle(path)
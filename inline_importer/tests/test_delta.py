@@ -0,0 +1,57 @@
+import sys
+from unittest import TestCase, skipIf
+
+from inline_importer import builder, delta, InlinerException
+from inline_importer.inliner import ModuleDefinition
+
+
+def bundle(modules, entrypoint="import pkg\n", **kwargs):
+    return builder.build_file(
+        {name: ModuleDefinition(name, name == "pkg", source) for name, source in modules.items()}, entrypoint, **kwargs
+    ).encode("utf-8")
+
+
+OLD = {"pkg": "VERSION = 1\n", "pkg.a": "A = 'a' * 4096\n", "pkg.b": "B = '\\x0c\\u2028'\n", "pkg.c": "C = 3\n"}
+NEW = {"pkg": "VERSION = 2\n", "pkg.a": "A = 'a' * 4096\n", "pkg.b": "B = '\\x0c\\u2028'\n", "pkg.d": "D = 4\n"}
+
+
+@skipIf(sys.version_info < (3, 8), "delta updates require python 3.8")
+class TestDelta(TestCase):
+    def assertRoundTrip(self, old, new):
+        patch = delta.diff_bundles(old, new)
+        self.assertEqual(delta.apply_patch(old, patch), new)
+        return patch
+
+    def test_parse_bundle(self):
+        for payload_format in ("dict", "blob"):
+            data = bundle(OLD, payload_format=payload_format)
+            parsed = delta.parse_bundle(data)
+
+            self.assertEqual(parsed.payload_format, payload_format)
+            self.assertEqual({name: m.source for name, m in parsed.modules.items()}, OLD)
+            self.assertEqual(delta.render_bundle(parsed), data)
+
+    def test_parse_modified_bundle(self):
+        with self.assertRaises(InlinerException):
+            delta.parse_bundle(bundle(OLD).replace(b"    'pkg.c'", b"  'pkg.c'"))
+
+    def test_round_trip(self):
+        patch = self.assertRoundTrip(bundle(OLD), bundle(NEW))
+
+        self.assertLess(len(patch), len(bundle(NEW)))
+
+    def test_round_trip_frame_and_format(self):
+        self.assertRoundTrip(bundle(OLD), bundle(NEW, entrypoint="import pkg.d\n", payload_format="blob"))
+
+    def test_round_trip_reordered(self):
+        self.assertRoundTrip(bundle(OLD), bundle(dict(reversed(list(NEW.items())))))
+
+    def test_apply_wrong_bundle(self):
+        patch = delta.diff_bundles(bundle(OLD), bundle(NEW))
+
+        with self.assertRaises(InlinerException):
+            delta.apply_patch(bundle(NEW), patch)
+
+    def test_apply_invalid_patch(self):
+        with self.assertRaises(InlinerException):
+            delta.apply_patch(bundle(OLD), b"not a patch")
@@ -0,0 +1,416 @@
+import importlib
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from unittest import TestCase, skipIf, skipUnless
+
+from inline_importer import builder
+from inline_importer.importer import InlineImporter
+from inline_importer.inliner import ModuleDefinition
+
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Preloads a payload-mode importer, forks workers that read every source and collect garbage, then prints the unique
+# set size (private pages, in KiB) of each worker.
+FORK_SCRIPT = """
+import gc, json, os, sys
+from inline_importer.importer import InlineImporter
+
+modules = {{"cow_mod{{}}".format(i): (False, "DATA = {{!r}}\\n".format("x" * 8000)) for i in range({count})}}
+
+class Importer(InlineImporter):
+    pass
+
+Importer.payload, Importer.inlined_modules = Importer.pack_payload(modules)
+sys.meta_path.insert(0, Importer)
+Importer.preload(["cow_mod0"])
+
+def uss():
+    with open("/proc/self/smaps_rollup") as f:
+        return sum(int(line.split()[1]) for line in f if line.startswith(("Private_Clean:", "Private_Dirty:")))
+
+r, w = os.pipe()
+pids = []
+for _ in range({workers}):
+    pid = os.fork()
+    if pid == 0:
+        for name in modules:
+            Importer.get_source(name)
+        gc.collect()
+        os.write(w, "{{}}\\n".format(uss()).encode())
+        os._exit(0)
+    pids.append(pid)
+os.close(w)
+for pid in pids:
+    os.waitpid(pid, 0)
+with os.fdopen(r) as f:
+    print(json.dumps([int(line) for line in f]))
+"""
+
+
+class TestDistributions(TestCase):
+    def setUp(self) -> None:
+        class Importer(InlineImporter):
+            distributions = {
+                "fake_dist": {
+                    "METADATA": "Metadata-Version: 2.1\nName: fake-dist\nVersion: 1.2.3\n",
+                    "entry_points.txt": "[console_scripts]\nfake = fake.cli:main\n",
+                }
+            }
+
+        self.importer = Importer
+
+    def test_normalize_distribution_name(self):
+        self.assertEqual(InlineImporter.normalize_distribution_name("Fake-Dist"), "fake_dist")
+        self.assertEqual(InlineImporter.normalize_distribution_name("fake.._dist"), "fake_dist")
+
+    def test_find_distributions_empty(self):
+        self.assertEqual(list(InlineImporter.find_distributions()), [])
+
+    @skipIf(sys.version_info < (3, 8), "importlib.metadata requires python 3.8")
+    def test_find_distributions(self):
+        from importlib.metadata import DistributionFinder
+
+        dists = list(self.importer.find_distributions(DistributionFinder.Context(name="Fake.Dist")))
+        self.assertEqual(len(dists), 1)
+        self.assertEqual(dists[0].version, "1.2.3")
+        self.assertEqual([ep.name for ep in dists[0].entry_points], ["fake"])
+
+        self.assertEqual(len(list(self.importer.find_distributions(DistributionFinder.Context()))), 1)
+        self.assertEqual(list(self.importer.find_distributions(DistributionFinder.Context(name="other"))), [])
+
+
+class TestStdlib(TestCase):
+    def importer(self, version):
+        class Importer(InlineImporter):
+            inlined_modules = {"json": (True, ""), "json.decoder": (False, "")}
+            stdlib_modules = frozenset(["json", "json.decoder"])
+            stdlib_version = version
+
+        return Importer
+
+    def test_find_spec(self):
+        spec = self.importer((sys.implementation.name, sys.hexversion)).find_spec("json")
+
+        self.assertEqual(spec.origin, os.path.join(os.path.dirname(os.__file__), "json", "__init__.py"))
+        self.assertIn(os.path.join(os.path.dirname(os.__file__), "json"), spec.submodule_search_locations)
+
+    def test_find_spec_version_mismatch(self):
+        importer = self.importer((sys.implementation.name, sys.hexversion - 1))
+
+        self.assertIsNone(importer.find_spec("json"))
+        self.assertIsNone(importer.find_spec("json.decoder"))
+
+
+class TestAbsentModules(TestCase):
+    def setUp(self) -> None:
+        class Importer(InlineImporter):
+            inlined_modules = {"present": (False, "")}
+            absent_modules = frozenset(["present", "_inline_importer_absent"])
+
+        self.importer = Importer
+        sys.meta_path.insert(0, Importer)
+        self.addCleanup(sys.meta_path.remove, Importer)
+
+    def test_find_spec(self):
+        self.assertIsNotNone(self.importer.find_spec("present"))
+        self.assertIsNone(self.importer.find_spec("other"))
+
+        with self.assertRaises(ModuleNotFoundError) as cm:
+            self.importer.find_spec("_inline_importer_absent")
+        self.assertEqual("_inline_importer_absent", cm.exception.name)
+
+    def test_import(self):
+        with self.assertRaises(ModuleNotFoundError):
+            import _inline_importer_absent  # noqa: F401
+
+    def test_probe_absent(self):
+        self.importer.probe_absent = True
+
+        self.assertIsNone(self.importer.find_spec("_inline_importer_absent"))
+
+
+class TestReloadBundle(TestCase):
+    modules = {
+        "hr_pkg": (True, "from . import base\n"),
+        "hr_pkg.base": (False, "VALUE = 1\n"),
+        "hr_pkg.user": (False, "from .base import VALUE\nDOUBLE = VALUE * 2\n"),
+        "hr_other": (False, "OTHER = 1\n"),
+        "hr_removed": (False, ""),
+    }
+
+    def setUp(self) -> None:
+        class Importer(InlineImporter):
+            inlined_modules = dict(self.modules)
+
+        self.importer = Importer
+        sys.meta_path.insert(0, Importer)
+
+    def tearDown(self) -> None:
+        sys.meta_path.remove(self.importer)
+        for name in self.modules:
+            sys.modules.pop(name, None)
+        sys.modules.pop("hr_added", None)
+
+    def test_read_bundle(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "bundle.py")
+            builder.write_file(path, {n: ModuleDefinition(n, p, s) for n, (p, s) in self.modules.items()}, "")
+
+            self.assertEqual(InlineImporter.read_bundle(path), self.modules)
+
+    def test_reload_bundle(self):
+        import hr_pkg.user
+        import hr_other
+
+        self.assertEqual(hr_pkg.user.DOUBLE, 2)
+
+        bundle = dict(self.modules)
+        bundle["hr_pkg.base"] = (False, "VALUE = 21\n")
+        bundle["hr_added"] = (False, "ADDED = True\n")
+        del bundle["hr_removed"]
+        report = self.importer.reload_bundle(bundle)
+
+        self.assertEqual(report.changed, ["hr_pkg.base"])
+        self.assertEqual(report.added, ["hr_added"])
+        self.assertEqual(report.removed, ["hr_removed"])
+        self.assertEqual(report.reloaded, ["hr_pkg.base", "hr_pkg", "hr_pkg.user"])
+        self.assertEqual(hr_pkg.user.DOUBLE, 42)
+        self.assertIs(sys.modules["hr_other"], hr_other)
+
+        import hr_added
+
+        self.assertTrue(hr_added.ADDED)
+
+    def test_reload_bundle_attributes(self):
+        self.importer.absent_modules = frozenset(["hr_gone"])
+        self.importer.distributions = {"hr_dist": {"METADATA": "Name: hr-dist\n"}}
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "bundle.py")
+            modules = {n: ModuleDefinition(n, p, s) for n, (p, s) in self.modules.items()}
+            builder.write_file(path, modules, "", stdlib_modules=["hr_other"], absent_modules=["hr_missing"])
+
+            self.assertEqual(
+                InlineImporter.read_bundle_attributes(path),
+                {
+                    "inlined_modules": self.modules,
+                    "stdlib_modules": frozenset(["hr_other"]),
+                    "stdlib_version": (sys.implementation.name, sys.hexversion),
+                    "absent_modules": frozenset(["hr_missing"]),
+                },
+            )
+
+            self.importer.reload_bundle(path)
+
+        self.assertEqual(self.importer.stdlib_modules, frozenset(["hr_other"]))
+        self.assertEqual(self.importer.stdlib_version, (sys.implementation.name, sys.hexversion))
+        self.assertEqual(self.importer.absent_modules, frozenset(["hr_missing"]))
+        self.assertEqual(self.importer.distributions, {})
+        self.assertIsNone(self.importer.find_spec("hr_gone"))
+        with self.assertRaises(ImportError):
+            self.importer.find_spec("hr_missing")
+
+
+class TestPayload(TestCase):
+    modules = {
+        "pl_pkg": (True, "NAME = 'pl_pkg'\n"),
+        "pl_pkg.mod": (False, "# \u00e9t\u00e9\nVALUE = '\u2603'\n"),
+    }
+
+    def setUp(self) -> None:
+        class Importer(InlineImporter):
+            pass
+
+        Importer.payload, Importer.inlined_modules = Importer.pack_payload(self.modules)
+        self.importer = Importer
+
+    def tearDown(self) -> None:
+        if self.importer in sys.meta_path:
+            sys.meta_path.remove(self.importer)
+        for name in self.modules:
+            sys.modules.pop(name, None)
+
+    def test_get_source(self):
+        self.assertIsInstance(self.importer.payload, bytes)
+        for name, (_, source) in self.modules.items():
+            self.assertEqual(self.importer.get_source(name), source)
+
+    def test_preload(self):
+        sys.meta_path.insert(0, self.importer)
+        self.importer.preload(freeze=False)
+
+        self.assertEqual(sys.modules["pl_pkg.mod"].VALUE, "\u2603")
+
+    def test_read_bundle(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "bundle.py")
+            modules = {n: ModuleDefinition(n, p, s) for n, (p, s) in self.modules.items()}
+            builder.write_file(path, modules, "", payload_format="blob")
+
+            self.assertEqual(InlineImporter.read_bundle(path), self.modules)
+
+    def test_reload_bundle_keeps_payload(self):
+        bundle = dict(self.modules, **{"pl_pkg.mod": (False, "VALUE = 'new'\n")})
+        report = self.importer.reload_bundle(bundle)
+
+        self.assertEqual(report.changed, ["pl_pkg.mod"])
+        self.assertIsInstance(self.importer.inlined_modules["pl_pkg.mod"][1], tuple)
+        self.assertEqual(self.importer.get_source("pl_pkg.mod"), "VALUE = 'new'\n")
+
+    @skipUnless(os.path.exists("/proc/self/smaps_rollup") and hasattr(os, "fork"), "requires linux smaps_rollup")
+    def test_fork_shares_payload(self):
+        count, workers = 2000, 4
+        env = dict(os.environ, PYTHONPATH=ROOT)
+        output = subprocess.check_output(
+            [sys.executable, "-c", FORK_SCRIPT.format(count=count, workers=workers)], env=env
+        )
+        uss = json.loads(output)
+        payload_kib = count * 8000 // 1024
+
+        self.assertEqual(len(uss), workers)
+        self.assertLess(max(uss), payload_kib // 4, "workers should not hold private copies of the payload")
+
+
+class TestThreadSafety(TestCase):
+    count = 48
+    threads = 64
+
+    def setUp(self) -> None:
+        modules = {"ts_pkg": (True, "")}
+        for i in range(self.count):
+            # Each module imports its two predecessors, so that imports overlap between threads.
+            imports = "".join("from ts_pkg import m{}\n".format(j) for j in (i - 1, i - 2) if j >= 0)
+            modules["ts_pkg.m{}".format(i)] = (False, imports + "VALUE = {}\n".format(i))
+
+        compiled = {}
+        executed = {}
+        counter_lock = threading.Lock()
+
+        class Importer(InlineImporter):
+            inlined_modules = modules
+
+            @classmethod
+            def source_to_code(cls, data, path="<string>"):
+                with counter_lock:
+                    compiled[path] = compiled.get(path, 0) + 1
+                return super().source_to_code(data, path)
+
+            @classmethod
+            def exec_module(cls, module):
+                with counter_lock:
+                    executed[module.__name__] = executed.get(module.__name__, 0) + 1
+                super().exec_module(module)
+
+        self.modules = modules
+        self.importer = Importer
+        self.compiled = compiled
+        self.executed = executed
+        sys.meta_path.insert(0, Importer)
+
+    def tearDown(self) -> None:
+        sys.meta_path.remove(self.importer)
+        for name in self.importer.inlined_modules:
+            sys.modules.pop(name, None)
+
+    def run_threads(self, target):
+        barrier = threading.Barrier(self.threads)
+        errors = []
+
+        def run(index):
+            barrier.wait()
+            try:
+                target(index)
+            except Exception as e:  # pragma: no cover - reported below
+                errors.append(e)
+
+        threads = [threading.Thread(target=run, args=(i,)) for i in range(self.threads)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+
+    def test_concurrent_get_code(self):
+        names = sorted(self.importer.inlined_modules)
+
+        def target(index):
+            for name in names[index % 8:] + names[:index % 8]:
+                self.assertIsNotNone(self.importer.get_code(name))
+
+        self.run_threads(target)
+
+        self.assertEqual(len(self.compiled), len(names))
+        self.assertEqual(self.importer._compiling, {}, "code objects should not be kept once handed out")
+
+    def test_concurrent_get_code_compiles_once(self):
+        started = threading.Event()
+        source_to_code = self.importer.source_to_code
+
+        def slow_source_to_code(data, path="<string>"):
+            started.set()
+            # Keep the compilation in flight until every thread is waiting for it
+            time.sleep(0.5)
+            return source_to_code(data, path)
+
+        self.importer.source_to_code = slow_source_to_code
+        codes = []
+
+        self.run_threads(lambda index: codes.append(self.importer.get_code("ts_pkg.m0")))
+
+        self.assertTrue(started.is_set())
+        self.assertEqual(self.compiled, {"ts_pkg/m0.py": 1})
+        self.assertEqual(len(set(map(id, codes))), 1, "every thread should get the same code object")
+        self.assertEqual(self.importer._compiling, {})
+
+    def test_concurrent_reload_bundle(self):
+        # Sources change length between versions, so offsets into one payload are wrong in the other.
+        versions = [
+            {name: (package, source + "#" * (k * 7 + len(name))) for name, (package, source) in self.modules.items()}
+            for k in range(3)
+        ]
+        payload, self.importer.inlined_modules = InlineImporter.pack_payload(versions[0])
+        self.importer.payload = payload
+        names = sorted(self.modules)
+        # Switch threads as often as possible, so that imports run between the statements of reload_bundle
+        self.addCleanup(sys.setswitchinterval, sys.getswitchinterval())
+        sys.setswitchinterval(1e-6)
+
+        def target(index):
+            for i in range(20):
+                if index % 4 == 0:
+                    self.importer.reload_bundle(versions[(index + i) % len(versions)])
+                    continue
+                for name in names:
+                    self.assertIn(self.importer.get_source(name), [version[name][1] for version in versions])
+                    self.importer.get_code(name)
+
+        self.run_threads(target)
+
+        self.assertIs(self.importer.payload, payload)
+
+    def test_caches_are_per_class(self):
+        class Other(InlineImporter):
+            inlined_modules = {"ts_pkg": (False, "")}
+
+        self.assertEqual(self.importer.get_filename("ts_pkg"), "ts_pkg/__init__.py")
+        self.assertEqual(Other.get_filename("ts_pkg"), "ts_pkg.py")
+        self.assertIsNot(self.importer._filenames, Other._filenames)
+        self.assertIsNone(InlineImporter.__dict__["_filenames"])
+
+    def test_concurrent_imports(self):
+        def target(index):
+            # Overlapping sets of modules, starting at different points of the dependency chain.
+            for i in range(index % self.count, self.count, 7):
+                module = importlib.import_module("ts_pkg.m{}".format(i))
+                self.assertEqual(module.VALUE, i)
+
+        self.run_threads(target)
+
+        self.assertEqual(set(self.executed.values()), {1}, "every module should be executed once")
+        self.assertEqual(set(self.compiled.values()), {1}, "every module should be compiled once")
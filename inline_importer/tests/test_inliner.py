@@ -1,5 +1,11 @@
+import io
+import os
 import random
-from unittest import TestCase
+import sys
+import tarfile
+import tempfile
+import zipfile
+from unittest import mock, TestCase, skipIf
 
 from inline_importer import inliner, InlinerException
 
@@ -48,3 +54,171 @@ class TestRepository(TestCase):
 
         with self.assertRaises(InlinerException):
             self.repository.insert_module(md.name, md.source, md.is_package)
+
+
+class TestDistributions(TestCase):
+    @skipIf(sys.version_info < (3, 8), "importlib.metadata requires python 3.8")
+    def test_build_distributions(self):
+        from importlib.metadata import version
+
+        # setuptools is always installed, since setup.py imports it
+        distributions = inliner.build_distributions(["SetupTools"])
+
+        self.assertIn("setuptools", distributions)
+        metadata = distributions["setuptools"].get("METADATA") or distributions["setuptools"]["PKG-INFO"]
+        self.assertIn("Version: {}".format(version("setuptools")), metadata)
+
+    @skipIf(sys.version_info < (3, 8), "importlib.metadata requires python 3.8")
+    def test_build_distributions_missing(self):
+        with self.assertRaises(InlinerException):
+            inliner.build_distributions(["not-an-installed-distribution"])
+
+
+class TestArchives(TestCase):
+    members = {
+        "proj-1.0/setup.py": "from setuptools import setup\n",
+        "proj-1.0/src/top.py": "TOP = True\n",
+        "proj-1.0/src/pkg/__init__.py": "",
+        "proj-1.0/src/pkg/mod.py": "# -*- coding: latin-1 -*-\r\nVALUE = 'caf\xe9'\r\n",
+        "proj-1.0/src/pkg/sub/__init__.py": "SUB = True\n",
+        "proj-1.0/src/pkg/data/notes.py": "skipped = True\n",
+        "proj-1.0/src/pkg/README.txt": "not python\n",
+    }
+
+    def encoded(self, path):
+        return self.members[path].encode("latin-1" if "coding: latin-1" in self.members[path] else "utf-8")
+
+    def tar_bytes(self):
+        buffer = io.BytesIO()
+        with tarfile.open(fileobj=buffer, mode="w:gz") as tar:
+            for path in self.members:
+                data = self.encoded(path)
+                info = tarfile.TarInfo(path)
+                info.size = len(data)
+                tar.addfile(info, io.BytesIO(data))
+        return buffer.getvalue()
+
+    def assertModules(self, modules):
+        self.assertEqual(
+            [(m.name, m.is_package) for m in modules],
+            [("top", False), ("pkg", True), ("pkg.mod", False), ("pkg.sub", True)],
+        )
+        self.assertEqual(modules[2].source, "# -*- coding: latin-1 -*-\nVALUE = 'caf\xe9'\n")
+
+    def test_tar_stream(self):
+        self.assertModules(inliner.find_archive_modules(io.BytesIO(self.tar_bytes()), "proj-1.0/src/"))
+
+    def test_zip(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "proj-1.0-py3-none-any.whl")
+            with zipfile.ZipFile(path, "w") as z:
+                for member in self.members:
+                    z.writestr(member, self.encoded(member))
+
+            self.assertModules(inliner.find_archive_modules(path, "proj-1.0/src"))
+
+    def test_build_inlined(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "proj-1.0.tar.gz")
+            with open(path, "wb") as f:
+                f.write(self.tar_bytes())
+
+            repository = inliner.build_inlined([], [], archives=[(path, "proj-1.0/src")])
+
+        self.assertEqual(list(repository), ["top", "pkg", "pkg.mod", "pkg.sub"])
+        self.assertEqual(repository["pkg.sub"].source, "SUB = True\n")
+
+    def test_invalid_archive(self):
+        with self.assertRaises(InlinerException):
+            inliner.find_archive_modules(io.BytesIO(b"not an archive"))
+
+
+class TestStdlib(TestCase):
+    def test_find_module_imports(self):
+        source = "import a.b\nfrom . import c\nfrom .d import e\ntry:\n    import f\nexcept ImportError:\n    pass\n"
+        source += "def g():\n    import h\n"
+
+        self.assertEqual(
+            inliner.find_module_imports(source, "pkg.mod"),
+            {"a", "a.b", "pkg", "pkg.c", "pkg.d", "pkg.d.e", "f"},
+        )
+
+    def test_find_stdlib_module(self):
+        self.assertEqual(inliner.find_stdlib_module("json")[1], True)
+        self.assertEqual(inliner.find_stdlib_module("json.decoder")[1], False)
+        self.assertIsNone(inliner.find_stdlib_module("sys"))
+        self.assertIsNone(inliner.find_stdlib_module("inline_importer"))
+
+    def test_build_stdlib(self):
+        repository = inliner.Repository()
+        repository.insert_module("app", "import json\nfrom app import helpers\n", True)
+        repository.insert_module("app.helpers", "def f():\n    import argparse\n")
+
+        stdlib = inliner.build_stdlib(repository, "import app\n", ["textwrap"])
+
+        self.assertIn("json", stdlib)
+        self.assertIn("json.decoder", stdlib)
+        self.assertIn("textwrap", stdlib)
+        self.assertNotIn("argparse", stdlib)
+        self.assertNotIn("app", stdlib)
+        self.assertEqual(list(stdlib), sorted(stdlib))
+
+    def test_build_stdlib_invalid(self):
+        with self.assertRaises(InlinerException):
+            inliner.build_stdlib({}, "", ["inline_importer"])
+
+
+class TestOptionalImports(TestCase):
+    def test_find_guarded_imports(self):
+        source = "try:\n    import ujson as json\nexcept ImportError:\n    import json\n"
+        source += "try:\n    from ._speedups import fast\nexcept (ImportError, AttributeError):\n    fast = None\n"
+        source += "def f():\n    try:\n        import lxml.etree\n    except ModuleNotFoundError:\n        pass\n"
+        source += "try:\n    import unguarded\nexcept KeyError:\n    pass\n"
+
+        self.assertEqual(
+            inliner.find_guarded_imports(source, "pkg.mod"),
+            {"ujson", "pkg", "pkg._speedups", "pkg._speedups.fast", "lxml", "lxml.etree"},
+        )
+
+    def test_find_optional_imports(self):
+        repository = inliner.Repository()
+        repository.insert_module("app", "try:\n    from app import _speedups\nexcept ImportError:\n    pass\n", True)
+        repository.insert_module("app._speedups", "try:\n    import simplejson\nexcept Exception:\n    pass\n")
+
+        self.assertEqual(inliner.find_optional_imports(repository), {"simplejson"})
+
+    def test_find_absent_modules(self):
+        names = ["json", "json.nope", "_inline_importer_nope", "_inline_importer_nope.sub", "os.path", "sys.argv"]
+
+        self.assertEqual(inliner.find_absent_modules(names), {"json.nope", "_inline_importer_nope"})
+
+    def test_find_absent_modules_skips_attributes(self):
+        repository = inliner.Repository()
+        source = "try:\n    from json import loads, _inline_importer_nope\nexcept ImportError:\n    pass\n"
+        repository.insert_module("app", source)
+
+        self.assertEqual(
+            inliner.find_absent_modules(inliner.find_optional_imports(repository)), {"json._inline_importer_nope"}
+        )
+
+    def test_find_absent_modules_isolated(self):
+        with tempfile.TemporaryDirectory() as directory:
+            with open(os.path.join(directory, "_inline_importer_on_path.py"), "w") as f:
+                f.write("")
+            with mock.patch.dict(os.environ, PYTHONPATH=directory):
+                absent = inliner.find_absent_modules(["_inline_importer_on_path"])
+
+        self.assertEqual(absent, {"_inline_importer_on_path"})
+
+    def test_find_absent_modules_invalid_python(self):
+        with self.assertRaises(InlinerException):
+            inliner.find_absent_modules(["json"], "/nonexistent/python")
+
+    def test_dotted_probe_marks_topmost_parent(self):
+        repository = inliner.Repository()
+        source = "try:\n    import _inline_importer_nope.speedups\nexcept ImportError:\n    pass\n"
+        repository.insert_module("app", source)
+
+        absent = inliner.find_absent_modules(inliner.find_optional_imports(repository))
+
+        self.assertEqual(absent, {"_inline_importer_nope"})
@@ -0,0 +1,66 @@
+import os
+import sys
+from unittest import TestCase, skipIf
+
+from inline_importer import inliner, pipeline, InlinerException
+from inline_importer.inliner import ModuleDefinition
+
+PACKAGE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def upper_stage(module_def, suffix=""):
+    return module_def._replace(source=module_def.source.upper() + suffix)
+
+
+class TestPipeline(TestCase):
+    def test_register_duplicate(self):
+        p = pipeline.Pipeline.default()
+
+        with self.assertRaises(InlinerException):
+            p.register("read", upper_stage)
+
+    def test_invalid_workers(self):
+        with self.assertRaises(InlinerException):
+            pipeline.Pipeline(workers=0)
+
+    def test_run(self):
+        p = pipeline.Pipeline()
+        p.register("upper", upper_stage, suffix="#")
+
+        result = p.run([ModuleDefinition("a", False, "x = 1"), ModuleDefinition("b", False, "y = 2")])
+
+        self.assertEqual([m.source for m in result], ["X = 1#", "Y = 2#"])
+        self.assertEqual([(s.name, s.calls) for s in p.statistics], [("upper", 2)])
+
+    def test_compile_module_invalid(self):
+        with self.assertRaises(InlinerException):
+            pipeline.compile_module(ModuleDefinition("a", False, "x = ("))
+
+    def test_parallel_matches_serial(self):
+        serial = inliner.build_inlined([], [PACKAGE])
+        parallel = inliner.build_inlined([], [PACKAGE], pipeline=pipeline.Pipeline.default(workers=2, validate=True))
+
+        self.assertEqual(list(serial.items()), list(parallel.items()))
+
+    @skipIf(sys.version_info < (3, 8), "transforms require python 3.8")
+    def test_transform_stage(self):
+        p = pipeline.Pipeline.default(validate=True, drop_annotations=True)
+        source = "from typing import List\ndef f(x: List[int]) -> None:\n    return x\n"
+
+        result = p.run([ModuleDefinition("a", False, source), ModuleDefinition("b", False, "x = 1\n")])
+
+        self.assertEqual([name for name, _ in p.stages], ["read", "transform", "compile"])
+        self.assertEqual(result[0].source, "pass\ndef f(x) :\n    return x\n")
+        self.assertEqual(result[1].source, "x = 1\n")
+        self.assertEqual(p.reports, {"transform": {"a": ["typing"]}})
+
+    @skipIf(sys.version_info < (3, 8), "transforms require python 3.8")
+    def test_transform_parallel_matches_serial(self):
+        serial = pipeline.Pipeline.default(strip_typing=True)
+        parallel = pipeline.Pipeline.default(workers=2, strip_typing=True)
+
+        self.assertEqual(
+            list(inliner.build_inlined([], [PACKAGE], pipeline=serial).items()),
+            list(inliner.build_inlined([], [PACKAGE], pipeline=parallel).items()),
+        )
+        self.assertEqual(serial.reports, parallel.reports)
@@ -0,0 +1,136 @@
+import sys
+from unittest import TestCase, skipIf
+
+from inline_importer import transforms, InlinerException
+from inline_importer.inliner import ModuleDefinition
+
+SOURCE = '''"""Module docstring."""
+import os
+import typing
+from typing import TYPE_CHECKING, Dict, List
+
+if TYPE_CHECKING:
+    from decimal import Decimal
+
+
+def f(x: List[int], y: "Decimal" = 3, **kw: typing.Any) -> Dict:
+    return os.getcwd()
+
+
+class C:
+    a: int = 1
+'''
+
+
+@skipIf(sys.version_info < (3, 8), "transforms require python 3.8")
+class TestStripTyping(TestCase):
+    def assertSameLines(self, source, result):
+        self.assertEqual(source.count("\n"), result.source.count("\n"), "line count should be preserved")
+        try:
+            compile(result.source, "stripped.py", "exec", dont_inherit=True)
+        except SyntaxError:
+            self.fail("stripped source should be valid")
+
+    def test_strip_type_checking(self):
+        result = transforms.strip_typing(SOURCE)
+
+        self.assertSameLines(SOURCE, result)
+        self.assertNotIn("Decimal\n", result.source)
+        self.assertIn("from typing import TYPE_CHECKING, Dict, List\n", result.source)
+        self.assertEqual(result.removed_imports, [])
+
+    def test_drop_annotations(self):
+        result = transforms.strip_typing(SOURCE, drop_annotations=True)
+
+        self.assertSameLines(SOURCE, result)
+        self.assertIn("def f(x, y = 3, **kw) :\n", result.source)
+        self.assertIn("    a: int = 1\n", result.source)
+        self.assertIn("import os\n", result.source)
+        self.assertEqual(result.removed_imports, ["typing"])
+
+    def test_removed_imports_skips_kept_modules(self):
+        source = "import typing\nfrom typing import List\nX = typing.cast(int, 1)\ndef f(x: List): pass\n"
+        result = transforms.strip_typing(source, drop_annotations=True)
+
+        self.assertIn("import typing\n", result.source)
+        self.assertNotIn("from typing import List\n", result.source)
+        self.assertEqual(result.removed_imports, [])
+
+    def test_drop_annotations_removed_imports(self):
+        source = "from collections import abc\ndef f(x: abc.Sized): pass\n"
+        result = transforms.strip_typing(source, drop_annotations=True)
+
+        self.assertSameLines(source, result)
+        self.assertEqual(result.removed_imports, ["collections"])
+
+    def test_future_annotations(self):
+        source = "from __future__ import annotations\nfrom collections import abc\ndef f(x: abc.Sized): pass\n"
+        result = transforms.strip_typing(source)
+
+        self.assertSameLines(source, result)
+        self.assertEqual(result.source, source)
+        self.assertEqual(result.removed_imports, [])
+
+    def test_future_annotations_keeps_singledispatch(self):
+        source = "from __future__ import annotations\nfrom functools import singledispatch\n"
+        source += "from decimal import Decimal\n@singledispatch\ndef f(x): return 'object'\n"
+        source += "@f.register\ndef _(x: Decimal): return 'decimal'\n"
+        result = transforms.strip_typing(source)
+
+        self.assertEqual(result.source, source)
+        self.assertEqual(result.removed_imports, [])
+
+        namespace = {}
+        exec(compile(result.source, "stripped.py", "exec", dont_inherit=True), namespace)
+        self.assertEqual(namespace["f"](namespace["Decimal"](1)), "decimal")
+
+    def test_deleted_import_is_kept(self):
+        source = "from collections import abc\ndef f(x: abc.Sized): pass\ndel abc\n"
+        result = transforms.strip_typing(source, drop_annotations=True)
+
+        self.assertIn("from collections import abc\n", result.source)
+        self.assertEqual(result.removed_imports, [])
+        exec(compile(result.source, "stripped.py", "exec", dont_inherit=True), {})
+
+    def test_future_annotations_keeps_class_variables(self):
+        source = "from __future__ import annotations\nfrom dataclasses import dataclass\nfrom typing import ClassVar\n"
+        source += "@dataclass\nclass C:\n    registry: ClassVar[dict] = {}\n"
+        result = transforms.strip_typing(source, drop_annotations=True)
+
+        self.assertEqual(result.source, source)
+        self.assertEqual(result.removed_imports, [])
+
+        # dataclasses resolves string annotations through the module of the class
+        module = sys.modules["stripped"] = type(sys)("stripped")
+        self.addCleanup(sys.modules.pop, "stripped")
+        exec(compile(result.source, "stripped.py", "exec", dont_inherit=True), module.__dict__)
+        self.assertEqual(module.C.registry, {})
+
+    def test_keeps_runtime_imports(self):
+        source = "from typing import NamedTuple, List\nclass P(NamedTuple):\n    x: List[int]\n"
+        result = transforms.strip_typing(source, drop_annotations=True)
+
+        self.assertEqual(result.source, source)
+        self.assertEqual(result.removed_imports, [])
+
+    def test_keeps_line_numbers(self):
+        result = transforms.strip_typing(SOURCE, drop_annotations=True)
+        namespace = {}
+        exec(compile(result.source, "stripped.py", "exec", dont_inherit=True), namespace)
+
+        self.assertEqual(namespace["f"].__code__.co_firstlineno, 10)
+
+    def test_invalid_source(self):
+        with self.assertRaises(InlinerException):
+            transforms.strip_typing("def f(:\n")
+
+    def test_strip_typing_repository(self):
+        source = "import typing\nfrom collections import abc\ndef f(x: abc.Sized) -> typing.Any: pass\n"
+        stripped, report = transforms.strip_typing_repository(
+            {"mod": ModuleDefinition("mod", False, source), "other": ModuleDefinition("other", False, SOURCE)},
+            drop_annotations=True,
+        )
+
+        self.assertEqual(stripped["mod"].name, "mod")
+        self.assertNotEqual(stripped["other"].source, SOURCE)
+        self.assertEqual(report, {"mod": ["typing", "collections"], "other": ["typing"]})
@@ -0,0 +1,106 @@
+import os
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from unittest import TestCase, skipUnless
+
+from inline_importer import builder
+from inline_importer.inliner import ModuleDefinition
+
+ENTRYPOINT = """import os
+import sys
+import _inline_importer_zygote
+import heavy
+
+print(_inline_importer_zygote.SERVED, heavy.LOADED, sys.argv[1:], os.getcwd(), os.environ.get("ZYGOTE_TEST"))
+print(sys.stdin.read())
+sys.exit(3)
+"""
+
+
+@skipUnless(sys.platform.startswith("linux") and hasattr(socket, "send_fds"), "requires a fork-server platform")
+class TestZygote(TestCase):
+    def setUp(self) -> None:
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+        modules = {"heavy": ModuleDefinition("heavy", False, "LOADED = True\n")}
+        self.script = os.path.join(self.directory.name, "bundle.py")
+        builder.write_file(self.script, modules, ENTRYPOINT, zygote=True, zygote_idle_timeout=30)
+
+        self.runtime = os.path.join(self.directory.name, "inline-importer-{}".format(os.getuid()))
+        self.addCleanup(self.kill_zygote)
+
+    def kill_zygote(self):
+        if not os.path.isdir(self.runtime):
+            return
+        for name in os.listdir(self.runtime):
+            if name.endswith(".lock"):
+                with open(os.path.join(self.runtime, name)) as f:
+                    pid = f.read()
+                if pid:
+                    try:
+                        os.kill(int(pid), signal.SIGTERM)
+                    except ProcessLookupError:
+                        pass
+
+    def run_script(self, *args, python_options=(), **env):
+        env = dict(os.environ, XDG_RUNTIME_DIR=self.directory.name, ZYGOTE_TEST="yes", **env)
+        return subprocess.run(
+            [sys.executable] + list(python_options) + [self.script] + list(args),
+            input=b"from stdin",
+            stdout=subprocess.PIPE,
+            cwd=self.directory.name,
+            env=env,
+        )
+
+    def wait_for_socket(self):
+        deadline = time.monotonic() + 10
+        while time.monotonic() < deadline:
+            if os.path.isdir(self.runtime) and any(name.endswith(".sock") for name in os.listdir(self.runtime)):
+                return
+            time.sleep(0.05)
+        self.fail("the zygote did not start")
+
+    def test_served_by_zygote(self):
+        cwd = os.path.realpath(self.directory.name)
+
+        first = self.run_script("a")
+        self.assertEqual(3, first.returncode)
+        self.assertEqual("False True ['a'] {} yes\nfrom stdin\n".format(cwd), first.stdout.decode())
+
+        self.wait_for_socket()
+
+        second = self.run_script("b", "--c")
+        self.assertEqual(3, second.returncode)
+        self.assertEqual("True True ['b', '--c'] {} yes\nfrom stdin\n".format(cwd), second.stdout.decode())
+
+    def test_disabled(self):
+        self.run_script()
+        self.wait_for_socket()
+
+        result = self.run_script(INLINE_IMPORTER_ZYGOTE="0")
+        self.assertEqual(3, result.returncode)
+        self.assertTrue(result.stdout.decode().startswith("False True"))
+
+    def test_runtime_identity(self):
+        self.run_script()
+        self.wait_for_socket()
+
+        optimized = self.run_script(python_options=["-O"])
+        self.assertEqual(3, optimized.returncode)
+        self.assertTrue(optimized.stdout.decode().startswith("False True"), "-O should not be served by the zygote")
+
+        other_path = self.run_script(PYTHONPATH=self.directory.name)
+        self.assertTrue(other_path.stdout.decode().startswith("False True"), "sys.path should match the zygote's")
+
+    def test_fingerprint(self):
+        modules = {"heavy": ModuleDefinition("heavy", False, "LOADED = True\n")}
+        other = {"heavy": ModuleDefinition("heavy", False, "LOADED = False\n")}
+
+        self.assertEqual(builder.fingerprint(modules, ENTRYPOINT), builder.fingerprint(modules, ENTRYPOINT))
+        self.assertNotEqual(builder.fingerprint(modules, ENTRYPOINT), builder.fingerprint(other, ENTRYPOINT))
+        self.assertNotEqual(builder.fingerprint(modules, ENTRYPOINT), builder.fingerprint(modules, ENTRYPOINT + "\n"))
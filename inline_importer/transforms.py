@@ -0,0 +1,331 @@
+"""Source transforms applied to modules before they are inlined.
+
+Transforms edit the source text in place rather than regenerating it from the AST, so comments, formatting and, most
+importantly, line numbers are preserved. Tracebacks raised from an inlined module still point at the right line of the
+original file.
+"""
+
+import ast
+import sys
+from collections import namedtuple
+
+from inline_importer import InlinerException
+from inline_importer.inliner import Repository
+
+TypingStripResult = namedtuple("TypingStripResult", "source removed_imports")
+"""A named tuple holding the result of `strip_typing`.
+
+``source`` is the transformed source, and ``removed_imports`` is the list of modules the transformed source no longer
+imports at startup.
+"""
+
+
+def _is_type_checking(node):
+    """Whether node is a ``TYPE_CHECKING`` or ``typing.TYPE_CHECKING`` expression."""
+    if isinstance(node, ast.Name):
+        return node.id == "TYPE_CHECKING"
+
+    if isinstance(node, ast.Attribute):
+        return node.attr == "TYPE_CHECKING" and isinstance(node.value, ast.Name)
+
+    return False
+
+
+def _imported_module(node, alias):
+    """The name of the module loaded by one alias of an import statement."""
+    if isinstance(node, ast.Import):
+        return alias.name
+
+    return "." * node.level + (node.module or "")
+
+
+def _bound_name(node, alias):
+    """The name bound in the importing namespace by one alias of an import statement."""
+    if alias.asname:
+        return alias.asname
+
+    if isinstance(node, ast.Import):
+        return alias.name.partition(".")[0]
+
+    return alias.name
+
+
+class _NameUsage(ast.NodeVisitor):
+    """Collects the names loaded by a module, split between runtime and prunable uses.
+
+    A use is prunable if it disappears once the transform runs: it is inside a removed ``TYPE_CHECKING`` block, a
+    stripped annotation, or the annotation of a local variable (which is never evaluated). Annotations postponed by
+    ``from __future__ import annotations`` are not prunable, since ``typing.get_type_hints``, ``singledispatch`` and
+    the like resolve them against the module's globals at runtime.
+
+    Deleting a name (``del name``) counts as a use, as it fails if the name was never bound.
+    """
+
+    def __init__(self, removed_blocks, stripped_annotations):
+        self.removed_blocks = removed_blocks
+        self.stripped_annotations = stripped_annotations
+        self.runtime = set()
+        self.prunable = set()
+        self._depth = 0
+        self._function_depth = 0
+
+    def _visit_prunable(self, node):
+        if node is None:
+            return
+        self._depth += 1
+        self.visit(node)
+        self._depth -= 1
+
+    def visit_If(self, node):
+        if node in self.removed_blocks:
+            self._visit_prunable(node.test)
+            for child in node.body:
+                self._visit_prunable(child)
+            return
+        self.generic_visit(node)
+
+    def _visit_annotation(self, node):
+        if node in self.stripped_annotations:
+            self._visit_prunable(node)
+        elif node is not None:
+            self.visit(node)
+
+    def visit_arg(self, node):
+        self._visit_annotation(node.annotation)
+
+    def _visit_function(self, node):
+        for decorator in node.decorator_list:
+            self.visit(decorator)
+        self.visit(node.args)
+        self._visit_annotation(node.returns)
+
+        self._function_depth += 1
+        for child in node.body:
+            self.visit(child)
+        self._function_depth -= 1
+
+    visit_FunctionDef = _visit_function
+    visit_AsyncFunctionDef = _visit_function
+
+    def visit_Lambda(self, node):
+        self._function_depth += 1
+        self.generic_visit(node)
+        self._function_depth -= 1
+
+    def visit_AnnAssign(self, node):
+        # Annotations of local variables are never evaluated, module and class level ones are stored in
+        # __annotations__ and resolved by dataclasses, NamedTuple, get_type_hints, etc., so they are runtime uses.
+        if self._function_depth:
+            self._visit_prunable(node.annotation)
+        else:
+            self.visit(node.annotation)
+        self.visit(node.target)
+        if node.value is not None:
+            self.visit(node.value)
+
+    def visit_Name(self, node):
+        if isinstance(node.ctx, (ast.Load, ast.Del)):
+            (self.prunable if self._depth else self.runtime).add(node.id)
+
+
+class _SourceEditor:
+    """Applies position-based edits to a source while keeping its line structure intact.
+
+    Positions are the ``(lineno, col_offset)`` pairs of the ``ast`` module, where columns are UTF-8 byte offsets.
+    """
+
+    def __init__(self, source):
+        self.lines = source.encode("utf-8").splitlines(True)
+        self.edits = []
+
+    def replace(self, start, end, replacement):
+        """Replace the text from start to end, padding replacement with the newlines of the replaced text."""
+        self.edits.append((start, end, replacement))
+
+    def text(self, start, end):
+        """Return the text between start and end."""
+        (start_line, start_col), (end_line, end_col) = start, end
+        if start_line == end_line:
+            return self.lines[start_line - 1][start_col:end_col].decode("utf-8")
+
+        chunks = [self.lines[start_line - 1][start_col:]]
+        chunks.extend(self.lines[start_line:end_line - 1])
+        chunks.append(self.lines[end_line - 1][:end_col])
+        return b"".join(chunks).decode("utf-8")
+
+    def apply(self):
+        """Apply the edits and return the resulting source."""
+        for start, end, replacement in sorted(self.edits, reverse=True):
+            (start_line, start_col), (end_line, end_col) = start, end
+            head = self.lines[start_line - 1][:start_col]
+            tail = self.lines[end_line - 1][end_col:]
+            padding = b"\n" * (end_line - start_line)
+            self.lines[start_line - 1:end_line] = [head + replacement.encode("utf-8") + padding + tail]
+
+        return b"".join(self.lines).decode("utf-8")
+
+
+def _occupies_lines(editor, node):
+    """Whether node is the only statement on the lines it spans (ignoring comments)."""
+    head = editor.lines[node.lineno - 1][:node.col_offset]
+    tail = editor.lines[node.end_lineno - 1][node.end_col_offset:].strip()
+    return not head.strip() and (not tail or tail.startswith(b"#"))
+
+
+def _walk(node, skip):
+    """Like `ast.walk`, without descending into the nodes of skip."""
+    todo = [node]
+    while todo:
+        node = todo.pop()
+        if node in skip:
+            continue
+        yield node
+        # skip may have been updated by the caller while it handled node.
+        if node not in skip:
+            todo.extend(ast.iter_child_nodes(node))
+
+
+def _strip_annotations(editor, tree, skip):
+    """Queue the removal of the argument and return annotations of every function in tree, outside of skip.
+
+    Returns the set of annotation nodes that will be removed.
+    """
+    stripped = set()
+    for node in _walk(tree, skip):
+        if not isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            continue
+
+        arguments = node.args.posonlyargs + node.args.args + node.args.kwonlyargs
+        arguments += [arg for arg in (node.args.vararg, node.args.kwarg) if arg is not None]
+        for arg in arguments:
+            if arg.annotation is None:
+                continue
+            start = (arg.lineno, arg.col_offset + len(arg.arg.encode("utf-8")))
+            end = (arg.annotation.end_lineno, arg.annotation.end_col_offset)
+            # Parenthesized annotations start before the annotation node, leave them alone.
+            if editor.text(start, (arg.annotation.lineno, arg.annotation.col_offset)).strip() == ":":
+                editor.replace(start, end, "")
+                stripped.add(arg.annotation)
+
+        # The return annotation sits outside of the parentheses, so it cannot span lines once removed.
+        if node.returns is not None and node.returns.lineno == node.returns.end_lineno:
+            returns_start = (node.returns.lineno, node.returns.col_offset)
+            line = editor.lines[node.returns.lineno - 1][:node.returns.col_offset]
+            arrow = line.rfind(b"->")
+            if arrow != -1 and not line[arrow + 2:].strip():
+                start = (node.returns.lineno, arrow)
+                editor.replace(start, (node.returns.end_lineno, node.returns.end_col_offset), "")
+                stripped.add(node.returns)
+
+    return stripped
+
+
+def strip_typing(source, drop_annotations=False, filename="<unknown>"):
+    # type: (str, bool, str) -> TypingStripResult
+    """Remove the typing-only parts of a module's source.
+
+    The following transforms are applied, all of which keep every statement on its original line:
+
+    * ``if TYPE_CHECKING:`` blocks (without an ``else`` clause) are replaced by ``pass``.
+    * If ``drop_annotations`` is set, function argument and return annotations are removed. Module and class level
+      variable annotations are kept, since dataclasses and named tuples depend on them. Code resolving function
+      annotations at runtime (``singledispatch``, ``typing.get_type_hints``, ...) no longer sees them.
+    * Module level imports whose names are only used in removed ``TYPE_CHECKING`` blocks, removed annotations or
+      local variable annotations are replaced by ``pass``. Annotations kept in the source are resolved at runtime by
+      many libraries, even when postponed with ``from __future__ import annotations``, so their imports are kept.
+
+    Args:
+        source (str): the source code of the module
+        drop_annotations (bool): whether to remove function annotations
+        filename (str): the name used when reporting syntax errors
+
+    Returns:
+        `TypingStripResult`: The transformed source and the modules that are no longer imported.
+
+    Raises:
+        `~inline_importer.InlinerException`: If the source cannot be parsed, or this python is older than 3.8.
+    """
+    if sys.version_info < (3, 8):
+        raise InlinerException("Stripping typing constructs requires python 3.8 or newer")
+
+    try:
+        tree = ast.parse(source, filename)
+    except SyntaxError as e:
+        raise InlinerException("Unable to parse {!r}: {}".format(filename, e))
+
+    editor = _SourceEditor(source)
+
+    removed_blocks = set()
+    for node in _walk(tree, removed_blocks):
+        if isinstance(node, ast.If) and not node.orelse and _is_type_checking(node.test):
+            if _occupies_lines(editor, node):
+                # The block is skipped from now on, so nested blocks are never removed twice.
+                removed_blocks.add(node)
+
+    stripped_annotations = set()
+    if drop_annotations:
+        # Annotations inside removed blocks would overlap with the block's edit.
+        stripped_annotations = _strip_annotations(editor, tree, removed_blocks)
+
+    usage = _NameUsage(removed_blocks, stripped_annotations)
+    usage.visit(tree)
+
+    # __all__ re-exports are runtime uses, even if they are not visible as loads.
+    for node in tree.body:
+        if isinstance(node, ast.Assign) and any(getattr(t, "id", None) == "__all__" for t in node.targets):
+            for element in getattr(node.value, "elts", ()):
+                if isinstance(element, ast.Constant) and isinstance(element.value, str):
+                    usage.runtime.add(element.value)
+
+    removed_imports = []
+    kept_imports = set()
+    for node in tree.body:
+        if not isinstance(node, (ast.Import, ast.ImportFrom)):
+            continue
+
+        names = [_bound_name(node, alias) for alias in node.names]
+        prunable = getattr(node, "module", None) != "__future__" and "*" not in names and _occupies_lines(editor, node)
+
+        if prunable and all(name in usage.prunable and name not in usage.runtime for name in names):
+            editor.replace((node.lineno, node.col_offset), (node.end_lineno, node.end_col_offset), "pass")
+            for alias in node.names:
+                module = _imported_module(node, alias)
+                if module not in removed_imports:
+                    removed_imports.append(module)
+        else:
+            kept_imports.update(_imported_module(node, alias) for alias in node.names)
+
+    # A module is still imported at startup if another import statement of it was kept.
+    removed_imports = [module for module in removed_imports if module not in kept_imports]
+
+    for node in removed_blocks:
+        editor.replace((node.lineno, node.col_offset), (node.end_lineno, node.end_col_offset), "pass")
+
+    return TypingStripResult(editor.apply(), removed_imports)
+
+
+def strip_typing_repository(repository, drop_annotations=False):
+    # type: (Union[Repository, Dict[str, ModuleDefinition]], bool) -> Tuple[Repository, Dict[str, List[str]]]
+    """Apply `strip_typing` to every module of a repository.
+
+    Args:
+        repository (`~inline_importer.inliner.Repository` or dict(str, `~inline_importer.inliner.ModuleDefinition`)):
+            Repository of modules
+        drop_annotations (bool): whether to remove function annotations
+
+    Returns:
+        tuple(`~inline_importer.inliner.Repository`, dict(str, list(str))): The transformed repository, and the
+        modules no longer imported at startup, keyed by the name of the module that used to import them. Modules with
+        no pruned import are omitted.
+    """
+    stripped = Repository()
+    report = {}
+
+    for name, module_def in repository.items():
+        filename = "{}.py".format(name.replace(".", "/"))
+        result = strip_typing(module_def.source, drop_annotations, filename)
+        stripped[name] = module_def._replace(source=result.source)
+        if result.removed_imports:
+            report[name] = result.removed_imports
+
+    return stripped, report
@@ -0,0 +1,296 @@
+"""Fork-server (zygote) runtime for bundled scripts.
+
+This module is inlined in scripts built in zygote mode, and only depends on the standard library.
+
+The first invocation of the script starts a zygote in the background, then runs normally. The zygote imports the
+heavy modules of the script once, and listens on a Unix socket private to the user. Later invocations connect to the
+zygote and hand it their arguments, environment, working directory and standard streams. The zygote forks a child,
+already warmed up, which runs the entrypoint and reports its exit status back.
+
+The socket is named after the fingerprint of the script, and the fingerprint is checked again when connecting, so an
+invocation is never served by a zygote running another version of the script. The fingerprint also covers the
+interpreter and its configuration (executable, version, command line flags, ``sys.path`` and ``PYTHON*`` environment
+variables), which a forked child cannot change. Whenever the zygote cannot be used
+(unsupported platform, no zygote yet, ``INLINE_IMPORTER_ZYGOTE=0`` in the environment, ...), the script runs normally.
+"""
+
+import atexit
+import gc
+import hashlib
+import json
+import os
+import signal
+import socket
+import sys
+import traceback
+from importlib import import_module
+
+SERVED = False
+"""Whether this process is a child of the zygote, serving an invocation of the script.
+"""
+
+_FORWARDED_SIGNALS = ("SIGINT", "SIGTERM", "SIGHUP", "SIGQUIT")
+
+
+def _supported():
+    """Whether this platform and environment support the zygote."""
+    return (
+        os.environ.get("INLINE_IMPORTER_ZYGOTE", "1") != "0"
+        and hasattr(os, "fork")
+        and hasattr(socket, "AF_UNIX")
+        and hasattr(socket, "send_fds")
+    )
+
+
+def _runtime_dir():
+    """Return the directory holding the zygote sockets of this user, or None if it is not private to the user."""
+    base = os.environ.get("XDG_RUNTIME_DIR") or os.environ.get("TMPDIR") or "/tmp"
+    path = os.path.join(base, "inline-importer-{}".format(os.getuid()))
+
+    try:
+        os.mkdir(path, 0o700)
+    except FileExistsError:
+        pass
+    except OSError:
+        return None
+
+    st = os.lstat(path)
+    if st.st_uid != os.getuid() or st.st_mode & 0o077 or not os.path.isdir(path) or os.path.islink(path):
+        return None
+
+    return path
+
+
+def _runtime_fingerprint(fingerprint):
+    """Combine the content fingerprint of the script with the identity of this interpreter."""
+    identity = [
+        fingerprint,
+        sys.executable,
+        sys.hexversion,
+        sys.implementation.name,
+        list(sys.flags),
+        sys.warnoptions,
+        sorted(getattr(sys, "_xoptions", {}).items()),
+        sys.path,
+        sorted((name, value) for name, value in os.environ.items() if name.startswith("PYTHON")),
+    ]
+    return hashlib.sha256(json.dumps(identity, default=str).encode("utf-8")).hexdigest()
+
+
+def _recv_exact(conn, size):
+    """Receive exactly size bytes from conn, or None if the connection is closed first."""
+    chunks = []
+    while size:
+        chunk = conn.recv(size)
+        if not chunk:
+            return None
+        chunks.append(chunk)
+        size -= len(chunk)
+
+    return b"".join(chunks)
+
+
+def _exit_status(code):
+    """Convert the code of a SystemExit to an exit status, like the interpreter does."""
+    if code is None:
+        return 0
+    if isinstance(code, int):
+        return code & 0xFF
+    print(code, file=sys.stderr)
+    return 1
+
+
+def _connect(path, fingerprint):
+    """Hand this invocation over to the zygote listening on path.
+
+    Returns the exit status of the invocation, or None if the zygote could not be used (and nothing was run).
+    """
+    conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        conn.connect(path)
+    except OSError:
+        conn.close()
+        return None
+
+    with conn:
+        try:
+            request = json.dumps(
+                {"fingerprint": fingerprint, "argv": sys.argv, "env": dict(os.environ), "cwd": os.getcwd()}
+            ).encode("utf-8")
+            socket.send_fds(conn, [len(request).to_bytes(4, "big")], [0, 1, 2])
+            conn.sendall(request)
+            accepted = _recv_exact(conn, 5)
+        except OSError:
+            return None
+
+        if accepted is None or accepted[0] != 1:
+            return None
+
+        # From now on the invocation is running in the child, so there is no falling back.
+        pid = int.from_bytes(accepted[1:], "big")
+        for name in _FORWARDED_SIGNALS:
+            signum = getattr(signal, name, None)
+            if signum is not None:
+                signal.signal(signum, lambda s, _: os.kill(pid, s))
+
+        try:
+            status = _recv_exact(conn, 4)
+        except OSError:
+            status = None
+
+        return 1 if status is None else int.from_bytes(status, "big", signed=True)
+
+
+def _serve_child(conn, code, namespace, fingerprint):
+    """Run one invocation in a freshly forked child of the zygote. Never returns."""
+    global SERVED
+
+    status = 1
+    try:
+        header, fds, _, _ = socket.recv_fds(conn, 4, 3)
+        header += _recv_exact(conn, 4 - len(header)) or b""
+        request = json.loads(_recv_exact(conn, int.from_bytes(header, "big")).decode("utf-8"))
+
+        if request["fingerprint"] != fingerprint or len(fds) != 3:
+            conn.sendall(b"\x00\x00\x00\x00\x00")
+            os._exit(0)
+
+        for target, fd in enumerate(fds):
+            os.dup2(fd, target)
+            os.close(fd)
+        for stream in (sys.stdout, sys.stderr):
+            if hasattr(stream, "reconfigure"):
+                stream.reconfigure(line_buffering=stream.isatty())
+
+        os.chdir(request["cwd"])
+        os.environ.clear()
+        os.environ.update(request["env"])
+        sys.argv[:] = request["argv"]
+        SERVED = True
+
+        conn.sendall(b"\x01" + os.getpid().to_bytes(4, "big"))
+
+        try:
+            exec(code, namespace)
+            status = 0
+        except SystemExit as e:
+            status = _exit_status(e.code)
+        except BaseException:
+            traceback.print_exc()
+            status = 1
+
+        atexit._run_exitfuncs()
+        for stream in (sys.stdout, sys.stderr):
+            stream.flush()
+        conn.sendall(status.to_bytes(4, "big", signed=True))
+    finally:
+        os._exit(status)
+
+
+def _serve(path, lock_path, code, namespace, fingerprint, idle_timeout, preload):
+    """Run the zygote until it has been idle for idle_timeout seconds."""
+    import fcntl
+
+    lock = os.open(lock_path, os.O_RDWR | os.O_CREAT, 0o600)
+    try:
+        fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        # Another zygote is already serving (or starting)
+        return
+
+    os.ftruncate(lock, 0)
+    os.write(lock, str(os.getpid()).encode("ascii"))
+
+    # A stale socket can only be left by a zygote that died, since we hold the lock.
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
+
+    for name in preload:
+        try:
+            import_module(name)
+        except Exception:
+            pass
+
+    if hasattr(gc, "freeze"):
+        gc.collect()
+        gc.freeze()
+
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    server.bind(path)
+    server.listen(128)
+    server.settimeout(idle_timeout)
+
+    # Children are reaped automatically
+    signal.signal(signal.SIGCHLD, signal.SIG_IGN)
+
+    try:
+        while True:
+            try:
+                conn, _ = server.accept()
+            except socket.timeout:
+                break
+
+            if os.fork() == 0:
+                server.close()
+                signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+                _serve_child(conn, code, namespace, fingerprint)
+            conn.close()
+    finally:
+        server.close()
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
+
+
+def _spawn(path, lock_path, code, namespace, fingerprint, idle_timeout, preload):
+    """Start a zygote in the background, detached from this process."""
+    pid = os.fork()
+    if pid:
+        os.waitpid(pid, 0)
+        return
+
+    try:
+        os.setsid()
+        if os.fork():
+            os._exit(0)
+
+        # Don't hold on to the standard streams of the invocation that started us.
+        null = os.open(os.devnull, os.O_RDWR)
+        for fd in (0, 1, 2):
+            os.dup2(null, fd)
+        os.close(null)
+
+        _serve(path, lock_path, code, namespace, fingerprint, idle_timeout, preload)
+    finally:
+        os._exit(0)
+
+
+def main(source, namespace, fingerprint, idle_timeout=600, preload=()):
+    """Run the entrypoint of a script, through the zygote if possible.
+
+    Args:
+        source (str): the source of the entrypoint
+        namespace (dict): the globals of the ``__main__`` module, in which the entrypoint runs
+        fingerprint (str): the content fingerprint of the script
+        idle_timeout (float): the number of seconds after which an idle zygote exits
+        preload (list(str)): the modules imported by the zygote before serving
+    """
+    code = compile(source, namespace.get("__file__", "<entrypoint>"), "exec")
+    fingerprint = _runtime_fingerprint(fingerprint)
+
+    directory = _runtime_dir() if _supported() else None
+    if directory is not None:
+        path = os.path.join(directory, "zygote-{}.sock".format(fingerprint[:24]))
+        status = _connect(path, fingerprint)
+        if status is not None:
+            sys.exit(status)
+
+        try:
+            _spawn(path, path + ".lock", code, namespace, fingerprint, idle_timeout, preload)
+        except OSError:
+            pass
+
+    exec(code, namespace)